@@ -1,90 +1,126 @@
 """
 Модуль контроля доступа к боту (с руководителями)
 """
-import aiosqlite
 import logging
+import time
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
-ACCESS_DB_FILE = 'bot_access.db'
 ADMIN_ID = 662128557  # @photon_27
+ACCESS_CACHE_TTL = 300  # секунд; через столько кэш перечитывается, чтобы увидеть правки БД в обход бота
+
+_GRANT_ACCESS = '''
+    INSERT INTO access_list (user_id, username, granted_by, is_active)
+    VALUES (?, ?, ?, 1)
+    ON CONFLICT(user_id) DO UPDATE SET
+        username = excluded.username,
+        is_active = 1,
+        granted_at = CURRENT_TIMESTAMP
+'''
+# Для руководителя: добавляем в access_list, если нет, иначе только включаем доступ
+_ACTIVATE_DIRECTOR = '''
+    INSERT INTO access_list (user_id, username, granted_by, is_active)
+    VALUES (?, ?, ?, 1)
+    ON CONFLICT(user_id) DO UPDATE SET
+        is_active = 1
+'''
+_ADD_DIRECTOR = '''
+    INSERT OR IGNORE INTO directors (user_id, added_by)
+    VALUES (?, ?)
+'''
+
+
+class Principal:
+    """Отправитель обновления: роль и доступ, определённые один раз на всё обновление."""
+    __slots__ = ('user_id', 'is_admin', 'is_director', 'has_access', 'employee_name')
+
+    def __init__(self, user_id, is_admin, is_director, has_access, employee_name=None):
+        self.user_id = user_id
+        self.is_admin = is_admin
+        self.is_director = is_director
+        self.has_access = has_access
+        self.employee_name = employee_name
+
+    def __repr__(self):
+        return (f"Principal(user_id={self.user_id}, is_admin={self.is_admin}, "
+                f"is_director={self.is_director}, has_access={self.has_access})")
 
 
 class AccessControl:
     """Класс для управления доступом к боту и руководителями"""
 
-    def __init__(self, db_path=ACCESS_DB_FILE):
-        self.db_path = db_path
+    def __init__(self, store, cache_ttl=ACCESS_CACHE_TTL):
+        self.store = store  # SqliteStore, общий с UserDatabase
         self.admin_id = ADMIN_ID
+        # Списки маленькие и меняются только через методы ниже, поэтому проверки идут по
+        # множествам в памяти; каждый изменяющий метод обновляет их после записи в БД
+        self.cache_ttl = cache_ttl
+        self._active_ids = frozenset()
+        self._director_ids = frozenset()
+        self._cache_expires = 0.0
+        # Счётчик изменений кэша: перечитывание, во время которого была запись, не затирает её
+        self._access_writes = 0
+
+    async def _reload_cache(self):
+        """Перечитывает активных пользователей и руководителей из БД."""
+        writes = self._access_writes
+        try:
+            async with self.store.committed_read() as db:
+                async with db.execute('SELECT user_id FROM access_list WHERE is_active = 1') as cursor:
+                    active_ids = frozenset(row[0] for row in await cursor.fetchall())
+                async with db.execute('SELECT user_id FROM directors') as cursor:
+                    director_ids = frozenset(row[0] for row in await cursor.fetchall())
+        except Exception as e:
+            # Оставляем прежний снимок и пробуем снова при следующей проверке
+            logger.error(f"Ошибка загрузки списков доступа: {e}")
+            return
+        if writes != self._access_writes:
+            # Снимок мог не увидеть запись, уже учтённую в кэше; перечитаем при следующей проверке
+            return
+        self._active_ids = active_ids
+        self._director_ids = director_ids
+        self._cache_expires = time.monotonic() + self.cache_ttl
+
+    async def _ensure_cache(self):
+        if time.monotonic() >= self._cache_expires:
+            await self._reload_cache()
 
     async def init_db(self):
-        """Инициализация базы данных доступа и таблицы руководителей."""
+        """Открывает общее хранилище (таблицы создаются его миграциями) и загружает списки доступа."""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                # Таблица обычного доступа
-                await db.execute('''
-                    CREATE TABLE IF NOT EXISTS access_list (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        granted_by INTEGER,
-                        granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        is_active BOOLEAN DEFAULT 1
-                    )
-                ''')
-                # Таблица руководителей
-                await db.execute('''
-                    CREATE TABLE IF NOT EXISTS directors (
-                        user_id INTEGER PRIMARY KEY,
-                        added_by INTEGER,
-                        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES access_list(user_id) ON DELETE CASCADE
-                    )
-                ''')
+            async with self.store.transaction() as tx:
+                db = tx.db
                 # Автоматически добавляем админа в access_list (если нет)
                 await db.execute('''
                     INSERT OR IGNORE INTO access_list (user_id, username, granted_by, is_active)
                     VALUES (?, 'photon_27', ?, 1)
                 ''', (self.admin_id, self.admin_id))
-                await db.commit()
-                logger.info(f"База данных доступа инициализирована: {self.db_path}")
+            logger.info(f"База данных доступа готова: {self.store.path}")
         except Exception as e:
             logger.error(f"Ошибка инициализации БД доступа: {e}")
+            return
+        await self._reload_cache()
 
     async def check_access(self, user_id: int) -> bool:
         """
         Проверить, есть ли у пользователя доступ (активный доступ или он руководитель).
         """
-        # Сначала проверяем активный доступ в access_list
-        try:
-            async with aiosqlite.connect(self.db_path) as db:
-                async with db.execute(
-                    'SELECT is_active FROM access_list WHERE user_id = ?',
-                    (user_id,)
-                ) as cursor:
-                    row = await cursor.fetchone()
-                    if row and row[0]:
-                        return True
-        except Exception as e:
-            logger.error(f"Ошибка проверки доступа: {e}")
-            return False
-
-        # Если нет активного доступа, проверяем, является ли руководителем
-        return await self.is_director(user_id)
+        await self._ensure_cache()
+        return user_id in self._active_ids or user_id in self._director_ids
 
     async def is_director(self, user_id: int) -> bool:
         """Проверить, является ли пользователь руководителем."""
-        try:
-            async with aiosqlite.connect(self.db_path) as db:
-                async with db.execute(
-                    'SELECT 1 FROM directors WHERE user_id = ?',
-                    (user_id,)
-                ) as cursor:
-                    row = await cursor.fetchone()
-                    return row is not None
-        except Exception as e:
-            logger.error(f"Ошибка проверки руководителя: {e}")
-            return False
+        await self._ensure_cache()
+        return user_id in self._director_ids
+
+    async def resolve_principal(self, user_id: int, employee_name=None) -> Principal:
+        """Роль и доступ пользователя одной проверкой; админ имеет доступ всегда."""
+        await self._ensure_cache()
+        is_admin = self.is_admin(user_id)
+        is_director = user_id in self._director_ids
+        has_access = is_admin or is_director or user_id in self._active_ids
+        return Principal(user_id, is_admin, is_director, has_access, employee_name)
 
     async def add_director(self, user_id: int, added_by: int):
         """
@@ -92,74 +128,102 @@ class AccessControl:
         Также автоматически добавляем его в access_list с активным доступом.
         """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.store.transaction() as tx:
+                db = tx.db
                 # Добавляем в access_list, если нет
-                await db.execute('''
-                    INSERT INTO access_list (user_id, username, granted_by, is_active)
-                    VALUES (?, ?, ?, 1)
-                    ON CONFLICT(user_id) DO UPDATE SET
-                        is_active = 1
-                ''', (user_id, f"user_{user_id}", added_by))
+                await db.execute(_ACTIVATE_DIRECTOR, (user_id, f"user_{user_id}", added_by))
                 # Добавляем в directors
-                await db.execute('''
-                    INSERT OR IGNORE INTO directors (user_id, added_by)
-                    VALUES (?, ?)
-                ''', (user_id, added_by))
-                await db.commit()
-                logger.info(f"Руководитель {user_id} назначен пользователем {added_by}")
+                await db.execute(_ADD_DIRECTOR, (user_id, added_by))
+            logger.info(f"Руководитель {user_id} назначен пользователем {added_by}")
+            self._activate({user_id}, directors=True)
         except Exception as e:
             logger.error(f"Ошибка назначения руководителя: {e}")
 
     async def remove_director(self, user_id: int):
         """Снять пользователя с должности руководителя (доступ остаётся, если был)."""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.store.transaction() as tx:
+                db = tx.db
                 await db.execute('DELETE FROM directors WHERE user_id = ?', (user_id,))
-                await db.commit()
-                logger.info(f"Руководитель {user_id} удалён")
+            logger.info(f"Руководитель {user_id} удалён")
+            self._access_writes += 1
+            self._director_ids -= {user_id}
         except Exception as e:
             logger.error(f"Ошибка удаления руководителя: {e}")
 
     async def grant_access(self, user_id: int, username: str, granted_by: int):
         """Выдать обычный доступ пользователю."""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute('''
-                    INSERT INTO access_list (user_id, username, granted_by, is_active)
-                    VALUES (?, ?, ?, 1)
-                    ON CONFLICT(user_id) DO UPDATE SET
-                        username = excluded.username,
-                        is_active = 1,
-                        granted_at = CURRENT_TIMESTAMP
-                ''', (user_id, username, granted_by))
-                await db.commit()
-                logger.info(f"Доступ выдан пользователю {user_id} ({username})")
+            async with self.store.transaction() as tx:
+                db = tx.db
+                await db.execute(_GRANT_ACCESS, (user_id, username, granted_by))
+            logger.info(f"Доступ выдан пользователю {user_id} ({username})")
+            self._activate({user_id})
         except Exception as e:
             logger.error(f"Ошибка выдачи доступа: {e}")
 
+    async def grant_access_many(self, grants, granted_by: int, tx=None):
+        """
+        Выдать доступ сразу многим пользователям одной транзакцией.
+        grants - список пар (user_id, username); tx - внешняя транзакция SqliteStore.
+        В отличие от одиночных методов ошибки не глотаются: транзакция откатывается целиком.
+        """
+        grants = list(grants)
+        if not grants:
+            return
+        async with self.store.transaction(tx) as tx:
+            await tx.db.executemany(
+                _GRANT_ACCESS, [(user_id, username, granted_by) for user_id, username in grants]
+            )
+            user_ids = frozenset(user_id for user_id, _ in grants)
+            tx.on_commit(lambda: self._activate(user_ids))
+        logger.info(f"Доступ выдан пользователям: {len(grants)}")
+
+    async def add_directors(self, user_ids, added_by: int, tx=None):
+        """Назначить руководителями сразу многих пользователей одной транзакцией (см. add_director)."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        async with self.store.transaction(tx) as tx:
+            await tx.db.executemany(
+                _ACTIVATE_DIRECTOR, [(user_id, f"user_{user_id}", added_by) for user_id in user_ids]
+            )
+            await tx.db.executemany(_ADD_DIRECTOR, [(user_id, added_by) for user_id in user_ids])
+            director_ids = frozenset(user_ids)
+            tx.on_commit(lambda: self._activate(director_ids, directors=True))
+        logger.info(f"Назначено руководителей: {len(user_ids)}")
+
+    def _activate(self, user_ids, directors=False):
+        """Обновляет кэш доступа после записи в БД."""
+        self._access_writes += 1
+        self._active_ids |= user_ids
+        if directors:
+            self._director_ids |= user_ids
+
     async def revoke_access(self, user_id: int):
         """Забрать обычный доступ (но руководитель остаётся руководителем)."""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.store.transaction() as tx:
+                db = tx.db
                 await db.execute(
                     'UPDATE access_list SET is_active = 0 WHERE user_id = ?',
                     (user_id,)
                 )
-                await db.commit()
-                logger.info(f"Доступ отозван у пользователя {user_id}")
+            logger.info(f"Доступ отозван у пользователя {user_id}")
+            self._access_writes += 1
+            self._active_ids -= {user_id}
         except Exception as e:
             logger.error(f"Ошибка отзыва доступа: {e}")
 
     async def get_all_users(self):
         """Получить список всех пользователей с активным доступом (не руководителей отдельно)."""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute(
-                    'SELECT * FROM access_list WHERE is_active = 1 ORDER BY granted_at DESC'
-                ) as cursor:
-                    rows = await cursor.fetchall()
-                    return [dict(row) for row in rows]
+            db = await self.store.connection()
+            async with db.execute(
+                'SELECT * FROM access_list WHERE is_active = 1 ORDER BY granted_at DESC'
+            ) as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
         except Exception as e:
             logger.error(f"Ошибка получения списка пользователей: {e}")
             return []
@@ -167,13 +231,12 @@ class AccessControl:
     async def get_all_directors(self):
         """Получить список всех руководителей."""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute(
-                    'SELECT d.*, a.username FROM directors d LEFT JOIN access_list a ON d.user_id = a.user_id ORDER BY d.added_at DESC'
-                ) as cursor:
-                    rows = await cursor.fetchall()
-                    return [dict(row) for row in rows]
+            db = await self.store.connection()
+            async with db.execute(
+                'SELECT d.*, a.username FROM directors d LEFT JOIN access_list a ON d.user_id = a.user_id ORDER BY d.added_at DESC'
+            ) as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
         except Exception as e:
             logger.error(f"Ошибка получения списка руководителей: {e}")
             return []
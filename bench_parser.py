@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Замер времени разбора графика: старый путь (pandas, read_excel на каждый лист)
+против потокового чтения книги за одно открытие.
+
+Запуск: python bench_parser.py [graph.xlsx]
+"""
+import sys
+import time
+import logging
+
+import pandas as pd
+
+from excel_parser import (
+    SERVICE_SHEET, iter_sheets_streaming, read_employees, sheet_month,
+    find_columns, sheet_to_shifts, merge_shifts,
+)
+
+
+def parse_pandas_per_sheet(file_path):
+    """Прежний способ: книга заново распаковывается для каждого листа."""
+    xl_file = pd.ExcelFile(file_path)
+    for sheet in xl_file.sheet_names:
+        if sheet == SERVICE_SHEET or sheet_month(sheet) is not None:
+            pd.read_excel(file_path, sheet_name=sheet)
+
+
+def parse_streaming(file_path):
+    """Новый способ: одно открытие книги, строки листов читаются потоком."""
+    schedule = {}
+    for sheet, rows in iter_sheets_streaming(file_path):
+        if sheet == SERVICE_SHEET:
+            read_employees(rows)
+            continue
+        if sheet_month(sheet) is None:
+            continue
+        columns = find_columns(next(rows, None) or ())
+        if columns is not None:
+            merge_shifts(schedule, sheet_to_shifts(rows, columns))
+    return schedule
+
+
+def measure(func, file_path, repeat=3):
+    """Лучшее время из нескольких прогонов."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(file_path)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    file_path = sys.argv[1] if len(sys.argv) > 1 else 'graph.xlsx'
+
+    pandas_time = measure(parse_pandas_per_sheet, file_path)
+    streaming_time = measure(parse_streaming, file_path)
+
+    print(f"Файл: {file_path}")
+    print(f"pandas, read_excel на каждый лист: {pandas_time:.3f} с")
+    print(f"потоковое чтение за одно открытие: {streaming_time:.3f} с")
+    print(f"ускорение: x{pandas_time / streaming_time:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Компактный двоичный снимок графика смен.
+
+Формат (версия 2), все секции выровнены по 4 байта:
+    заголовок  - магическая строка, версия, порядок байт, размеры секций;
+    dates      - int32[n_slots]   порядковый номер даты (date.toordinal()), по возрастанию;
+    starts     - int32[n_slots]   начало слота в минутах от полуночи;
+    ends       - int32[n_slots]   конец слота в минутах (через полночь - больше 1440);
+    emp_ids    - uint16[n_slots]  номер сотрудника в таблице имён;
+    time_ids   - uint16[n_slots]  номер исходной строки времени ("9:00-10:00");
+    employees  - uint16[n_emp]    список сотрудников из служебного листа;
+    strings    - имена и строки времени в UTF-8, разделённые нулевым байтом;
+    meta       - JSON с отпечатками листов.
+
+Файл читается одним вызовом read(): числовые массивы - это массивы NumPy поверх
+прочитанных байтов, без поэлементного разбора. Файл после чтения не удерживается
+(в отличие от mmap), поэтому следующий снимок можно атомарно записать на его место
+и в Windows. Секции совпадают с колонками ScheduleStore.
+"""
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+from schedule_store import ScheduleStore
+
+MAGIC = b'L15SNAP\0'
+VERSION = 2
+_HEADER = struct.Struct('<8sHBxIIIIII')  # magic, версия, порядок байт, n_slots, n_emp, n_names, n_times, strings, meta
+_BYTEORDER = 1 if sys.byteorder == 'little' else 2
+_COLUMNS = (('dates', np.int32), ('starts', np.int32), ('ends', np.int32),
+            ('emp_ids', np.uint16), ('time_ids', np.uint16))
+
+
+def _pad(size):
+    return (-size) % 4
+
+
+def write_snapshot(path, store, employees, meta):
+    """Атомарно записывает снимок: сначала во временный файл, затем переименование."""
+    names = list(store.names)
+    name_ids = dict(store.name_ids)
+    for employee in employees:
+        if employee not in name_ids:
+            name_ids[employee] = len(names)
+            names.append(employee)
+    employee_ids = np.array([name_ids[e] for e in employees], dtype=np.uint16)
+
+    strings = '\0'.join(names + store.time_labels).encode('utf-8')
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+    header = _HEADER.pack(MAGIC, VERSION, _BYTEORDER, len(store), len(employee_ids),
+                          len(names), len(store.time_labels), len(strings), len(meta_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        sections = [getattr(store, name).astype(dtype, copy=False) for name, dtype in _COLUMNS]
+        for section in sections + [employee_ids]:
+            data = section.tobytes()
+            f.write(data)
+            f.write(b'\0' * _pad(len(data)))
+        f.write(strings)
+        f.write(b'\0' * _pad(len(strings)))
+        f.write(meta_bytes)
+    os.replace(tmp_path, path)
+
+
+class SnapshotView:
+    """Снимок, прочитанный в память."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._buffer = f.read()
+        if len(self._buffer) < _HEADER.size:
+            raise ValueError(f"Файл снимка {path} обрезан")
+        (magic, version, byteorder, n_slots, n_emp, n_names, n_times,
+         strings_len, meta_len) = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != VERSION or byteorder != _BYTEORDER:
+            raise ValueError(f"Неподдерживаемый формат снимка {path}")
+
+        offset = _HEADER.size
+        columns = {}
+        for name, dtype in _COLUMNS + (('employees', np.uint16),):
+            count = n_emp if name == 'employees' else n_slots
+            columns[name] = np.frombuffer(self._buffer, dtype=dtype, count=count, offset=offset)
+            size = count * np.dtype(dtype).itemsize
+            offset += size + _pad(size)
+
+        strings = self._buffer[offset:offset + strings_len].decode('utf-8')
+        offset += strings_len + _pad(strings_len)
+        table = strings.split('\0') if n_names + n_times else []
+        names = table[:n_names]
+
+        self.employees = [names[i] for i in columns.pop('employees').tolist()]
+        self.store = ScheduleStore(names, table[n_names:], **columns)
+        self.meta = json.loads(self._buffer[offset:offset + meta_len].decode('utf-8')) if meta_len else {}
+
+
+def read_snapshot(path):
+    """Открывает снимок; ValueError/OSError, если файл повреждён или другого формата."""
+    return SnapshotView(path)
@@ -1,6 +1,8 @@
 import os
 import logging
+import calendar
 from datetime import datetime, timedelta, time
+from functools import lru_cache
 import asyncio
 import sys
 import glob
@@ -13,27 +15,60 @@ from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
-from excel_parser import ExcelParser
+from excel_parser import ExcelParser, shutdown_process_pool
 from logger import BotLogger
 from database import UserDatabase
-from access_control import AccessControl
+from sqlite_store import SqliteStore
+from fsm_storage import SqliteStorage
+from access_control import AccessControl, Principal
+from file_watcher import FileWatcher
+from slot_times import parse_slot
+from render_cache import RenderCache
 
 # Конфигурация
 BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN')
 LOG_CHAT_ID = '-5242231135'  # Ваш ID чата для логов
 EXCEL_FILE = os.getenv('EXCEL_FILE', 'graph.xlsx')
+EXCEL_RELOAD_DEBOUNCE = float(os.getenv('EXCEL_RELOAD_DEBOUNCE', '3'))  # секунд тишины перед перезагрузкой
+# Процессов для парсинга листов Excel; при значении > 1 запускайте бота через run.py
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', '1'))
+if PARSE_WORKERS > 1 and __name__ == '__main__':
+    # Процессы пула (spawn) заново исполняют модуль __main__: при запуске `python bot.py`
+    # каждый из них создавал бы своего бота, парсер и хранилище. run.py защищён __main__-проверкой
+    print("⚠️ PARSE_WORKERS > 1 работает только при запуске через run.py, парсинг будет в одном процессе")
+    PARSE_WORKERS = 1
+# Путь для выгрузки графика в JSON (по умолчанию выключена, бот работает с двоичным снимком)
+SCHEDULE_JSON_EXPORT = os.getenv('SCHEDULE_JSON_EXPORT') or None
+# Кэш готовых текстов расписания на день: число записей и время жизни в секундах
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', '512'))
+RENDER_CACHE_TTL = float(os.getenv('RENDER_CACHE_TTL', '600'))
+# Через сколько секунд перечитывать списки доступа из БД (правки в обход бота)
+ACCESS_CACHE_TTL = float(os.getenv('ACCESS_CACHE_TTL', '300'))
+# Общая БД пользователей и доступа (прежние bot_users.db и bot_access.db переносятся в неё автоматически)
+BOT_DB_FILE = os.getenv('BOT_DB_FILE', 'bot_data.db')
+# Сколько профилей пользователей держать в памяти перед БД
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1024'))
+# Состояния FSM: пауза перед пакетной записью в БД (сек), число состояний в памяти, простой до выгрузки (сек)
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', '1'))
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '2048'))
+FSM_IDLE_TTL = float(os.getenv('FSM_IDLE_TTL', '3600'))
 
 # Инициализация
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+store = SqliteStore(BOT_DB_FILE)
+storage = SqliteStorage(store, flush_interval=FSM_FLUSH_INTERVAL, cache_size=FSM_CACHE_SIZE,
+                        idle_ttl=FSM_IDLE_TTL)
 dp = Dispatcher(storage=storage)
-excel_parser = ExcelParser(EXCEL_FILE)
-db = UserDatabase()
-access_control = AccessControl()
+excel_parser = ExcelParser(EXCEL_FILE, json_path=SCHEDULE_JSON_EXPORT, workers=PARSE_WORKERS)
+db = UserDatabase(store, cache_size=USER_CACHE_SIZE)
+access_control = AccessControl(store, cache_ttl=ACCESS_CACHE_TTL)
 bot_logger = BotLogger(bot, LOG_CHAT_ID)
+# Тексты расписания на день: (дата, выделенный сотрудник, версия снимка) -> текст
+day_render_cache = RenderCache(RENDER_CACHE_SIZE, RENDER_CACHE_TTL)
+# Сообщения «Неделя»: (первый день, выделенный сотрудник, версия снимка) -> текст
+week_render_cache = RenderCache(RENDER_CACHE_SIZE, RENDER_CACHE_TTL)
 # Словарь активных проверок часов: user_id сотрудника -> данные проверки
 pending_hour_checks: dict = {}
 # Сессия сверки часов: director_id -> {всего сотрудников, подтверждённые данные}
@@ -101,14 +136,29 @@ if not EXCEL_FILE:
 
 print(f"📊 Загружен Excel файл: {EXCEL_FILE}")
 
+# Внешний middleware для сообщений и callback-запросов: один раз определяет отправителя
+# (роль, доступ, имя сотрудника) и кладёт его в data['principal'] для остальных
+# middleware и обработчиков
+async def resolve_principal_middleware(handler, event, data: dict):
+    user_id = event.from_user.id
+    user_data_db = await db.get_user(user_id)
+    employee_name = user_data_db.get('employee_name') if user_data_db else None
+    data['principal'] = await access_control.resolve_principal(user_id, employee_name)
+    return await handler(event, data)
+
+
+dp.message.outer_middleware(resolve_principal_middleware)
+dp.callback_query.outer_middleware(resolve_principal_middleware)
+
+
 # Middleware для логирования всех входящих сообщений (должен быть ПЕРВЫМ)
 @dp.message.middleware()
 async def log_all_messages_middleware(handler, event: types.Message, data: dict):
-    user_id = event.from_user.id
+    principal: Principal = data['principal']
     # Определяем роль пользователя
-    if access_control.is_admin(user_id):
+    if principal.is_admin:
         role = "👑 АДМИН"
-    elif await access_control.is_director(user_id):
+    elif principal.is_director:
         role = "🎯 РУКОВОДИТЕЛЬ"
     else:
         role = "👤 ПОЛЬЗОВАТЕЛЬ"
@@ -126,17 +176,11 @@ async def access_check_middleware(handler, event: types.Message, data: dict):
     """Middleware для проверки доступа к боту"""
     user_id = event.from_user.id
 
-    # Админ всегда имеет доступ
-    if access_control.is_admin(user_id):
-        return await handler(event, data)
-
-    # Проверяем, является ли пользователь руководителем
-    if await access_control.is_director(user_id):
+    # Админ и руководители всегда имеют доступ, это уже учтено в has_access
+    has_access = data['principal'].has_access
+    if has_access:
         return await handler(event, data)
 
-    # Проверка обычного доступа
-    has_access = await access_control.check_access(user_id)
-
     if not has_access and not (event.text and event.text.startswith('/start')):
         admin_info = access_control.get_admin_info()
         await event.answer(
@@ -166,6 +210,14 @@ async def access_check_middleware(handler, event: types.Message, data: dict):
     return await handler(event, data)
 
 
+async def _sync_state_data(state: FSMContext, **values):
+    """Записывает значения в данные FSM, только если они отличаются от сохранённых."""
+    user_data = await state.get_data()
+    changed = {key: value for key, value in values.items() if user_data.get(key) != value}
+    if changed:
+        await state.update_data(**changed)
+
+
 @dp.message.middleware()
 async def load_user_middleware(handler, event: types.Message, data: dict):
     """Middleware для загрузки данных пользователя"""
@@ -183,28 +235,29 @@ async def load_user_middleware(handler, event: types.Message, data: dict):
         )
         data['state'] = state
 
-    user_id = event.from_user.id
-
     # Получаем текущее состояние
     current_state = await state.get_state()
 
+    principal: Principal = data['principal']
+
+    # Флаг в FSM переживает перезапуск, поэтому сверяем его с текущей ролью каждый раз:
+    # снятие с должности руководителя должно действовать сразу
+    await _sync_state_data(state, is_director=principal.is_director)
+
     # Проверяем, не находится ли пользователь в процессе выбора имени
     if current_state == UserStates.choosing_name:
         return await handler(event, data)
 
     # Проверяем, является ли пользователь директором
-    is_director = await access_control.is_director(user_id)
-    if is_director:
-        await state.update_data(is_director=True)
+    if principal.is_director:
         if current_state is None:
             await state.set_state(UserStates.main_menu)
         return await handler(event, data)
 
-    # Загружаем данные из БД
-    user_data_db = await db.get_user(user_id)
-    if user_data_db and user_data_db.get('employee_name'):
+    # Имя из БД уже загружено вместе с principal
+    if principal.employee_name:
         # Сохраняем имя в состояние
-        await state.update_data(employee_name=user_data_db['employee_name'])
+        await _sync_state_data(state, employee_name=principal.employee_name)
 
         # Если состояние не установлено, переходим в главное меню
         if current_state is None:
@@ -213,15 +266,33 @@ async def load_user_middleware(handler, event: types.Message, data: dict):
     return await handler(event, data)
 
 # Клавиатуры
-def get_name_keyboard(employees):
-    """Клавиатура выбора имени сотрудника"""
-    keyboard = []
-    for emp in employees:
-        keyboard.append([KeyboardButton(text=emp)])
-    return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True, one_time_keyboard=True)
+# Разметка клавиатур не меняется после создания, поэтому готовые объекты
+# переиспользуются между сообщениями и не собираются (и не валидируются) заново.
+_name_keyboard_cache = {}  # версия снимка -> клавиатура выбора имени
+
+
+def get_name_keyboard():
+    """Клавиатура выбора имени сотрудника из текущего снимка графика"""
+    snapshot = excel_parser.snapshot
+    markup = _name_keyboard_cache.get(snapshot.version)
+    if markup is None:
+        keyboard = []
+        for emp in snapshot.employees:
+            keyboard.append([KeyboardButton(text=emp)])
+        markup = ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True, one_time_keyboard=True)
+        # Клавиатуры прошлых снимков больше не нужны
+        _name_keyboard_cache.clear()
+        _name_keyboard_cache[snapshot.version] = markup
+    return markup
 
 
 def get_main_menu_keyboard(is_director=False):
+    return _build_main_menu_keyboard(bool(is_director))
+
+
+@lru_cache(maxsize=2)
+def _build_main_menu_keyboard(is_director):
+    """Главное меню для роли: одно на всё время работы бота"""
     if is_director:
         keyboard = [
             [KeyboardButton(text="📅 Сегодня"), KeyboardButton(text="📅 Завтра")],
@@ -240,14 +311,19 @@ def get_main_menu_keyboard(is_director=False):
         ]
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
+
 def get_date_keyboard(year=None, month=None):
     """Клавиатура выбора даты с навигацией по месяцам"""
-    today = moscow_now()  # изменено
-
     if year is None or month is None:
+        today = moscow_now()  # изменено
         year = today.year
         month = today.month
+    return _build_month_keyboard(year, month)
+
 
+@lru_cache(maxsize=48)
+def _build_month_keyboard(year, month):
+    """Сетка месяца; от текущей даты не зависит, поэтому кэшируется по (год, месяц)"""
     keyboard = []
 
     month_names = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
@@ -275,7 +351,6 @@ def get_date_keyboard(year=None, month=None):
     ])
 
     first_day = datetime(year, month, 1)
-    import calendar
     days_in_month = calendar.monthrange(year, month)[1]
 
     start_weekday = first_day.weekday()
@@ -308,21 +383,14 @@ def _get_weekday(date):
     weekdays = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
     return weekdays[date.weekday()]
 
-def _pad_hour(time_str):
-    """Добавляет ведущий ноль к часу, если нужно."""
-    if ':' in time_str:
-        h, m = time_str.split(':')
-        return f"{int(h):02d}:{m}"
-    return time_str
-
 
 # Обработчики команд
 @dp.message(Command("start"))
-async def cmd_start(message: types.Message, state: FSMContext):
+async def cmd_start(message: types.Message, state: FSMContext, principal: Principal):
     """Обработчик команды /start"""
     user_id = message.from_user.id
-    is_admin = access_control.is_admin(user_id)
-    is_director = await access_control.is_director(user_id)
+    is_admin = principal.is_admin
+    is_director = principal.is_director
 
     admin_text = " 👑 <b>(Админ)</b>" if is_admin else ""
     director_text = " 🎯 <b>(Руководитель)</b>" if is_director else ""
@@ -344,12 +412,10 @@ async def cmd_start(message: types.Message, state: FSMContext):
         )
         return
 
-    # Для обычных пользователей (L1.5) – проверяем БД
-    user_data_db = await db.get_user(user_id)
-
-    if user_data_db and user_data_db['employee_name']:
-        await state.update_data(employee_name=user_data_db['employee_name'])
-        employee_name = user_data_db['employee_name']
+    # Для обычных пользователей (L1.5) – имя из БД уже загружено вместе с principal
+    if principal.employee_name:
+        employee_name = principal.employee_name
+        await state.update_data(employee_name=employee_name)
         welcome_text = f"👋 С возвращением{admin_text}, {employee_name}!\n\n"
         welcome_text += "Ваши данные восстановлены.\n"
         welcome_text += "Можете изменить настройки через меню ⚙️"
@@ -373,15 +439,14 @@ async def cmd_start(message: types.Message, state: FSMContext):
         await message.answer(
             f"👋 Добро пожаловать в бот управления графиком L1.5!{admin_text}\n\n"
             "Выберите ваше имя из списка:",
-            reply_markup=get_name_keyboard(employees),
+            reply_markup=get_name_keyboard(),
             parse_mode="HTML"
         )
 
 @dp.message(StateFilter(UserStates.main_menu), F.text == "📊 Отдел")
-async def department_stats_start(message: types.Message, state: FSMContext):
+async def department_stats_start(message: types.Message, state: FSMContext, principal: Principal):
     """Начало статистики отдела: выбор месяца."""
-    user_id = message.from_user.id
-    is_director = await access_control.is_director(user_id)
+    is_director = principal.is_director
     if not is_director:
         await message.answer("⛔ Эта функция доступна только руководителям.")
         return
@@ -412,9 +477,8 @@ async def department_stats_start(message: types.Message, state: FSMContext):
     )
 
 @dp.callback_query(F.data.startswith("dept_stats:"))
-async def process_department_stats(callback: types.CallbackQuery, state: FSMContext):
-    user_id = callback.from_user.id
-    is_director = await access_control.is_director(user_id)
+async def process_department_stats(callback: types.CallbackQuery, state: FSMContext, principal: Principal):
+    is_director = principal.is_director
     if not is_director:
         await callback.answer("⛔ Доступ запрещён", show_alert=True)
         return
@@ -500,11 +564,10 @@ async def back_to_dept_months(callback: types.CallbackQuery, state: FSMContext):
     )
 
 @dp.message(StateFilter(UserStates.main_menu), F.text == "📊 По сотрудникам")
-async def director_stats_choose_employee(message: types.Message, state: FSMContext):
+async def director_stats_choose_employee(message: types.Message, state: FSMContext, principal: Principal):
     """Показываем список сотрудников для выбора (руководитель)."""
-    # Проверяем, что пользователь – руководитель (можно по флагу в состоянии или через БД)
-    user_data = await state.get_data()
-    is_director = user_data.get('is_director', False) or await access_control.is_director(message.from_user.id)
+    # Проверяем, что пользователь – руководитель
+    is_director = principal.is_director
     if not is_director:
         await message.answer("⛔ Эта функция доступна только руководителям.")
         return
@@ -660,9 +723,9 @@ async def director_stats_back_to_months(callback: types.CallbackQuery, state: FS
     )
 
 @dp.message(Command("help"))
-async def cmd_help(message: types.Message):
+async def cmd_help(message: types.Message, principal: Principal):
     """Обработчик команды /help"""
-    is_admin = access_control.is_admin(message.from_user.id)
+    is_admin = principal.is_admin
 
     help_text = (
         "🤖 <b>Telegram бот для графика L1.5</b>\n\n"
@@ -680,7 +743,7 @@ async def cmd_help(message: types.Message):
 
     if is_admin:
         help_text += "\n<b>🔧 Команды администратора:</b>\n"
-        help_text += "/add [user_id] - Выдать доступ\n"
+        help_text += "/add [user_id ...] - Выдать доступ (можно несколько ID)\n"
         help_text += "/revoke [user_id] - Забрать доступ\n"
         help_text += "/makeadmin [user_id] - Назначить админа\n"
         help_text += "/users - Список пользователей\n"
@@ -697,9 +760,8 @@ async def cmd_help(message: types.Message):
 
 
 @dp.message(Command("menu"))
-async def cmd_menu(message: types.Message, state: FSMContext):
-    user_data = await state.get_data()
-    is_director = user_data.get('is_director', False) or await access_control.is_director(message.from_user.id)
+async def cmd_menu(message: types.Message, state: FSMContext, principal: Principal):
+    is_director = principal.is_director
     await state.set_state(UserStates.main_menu)
     await message.answer(
         "📋 Главное меню:",
@@ -728,7 +790,7 @@ async def cmd_today(message: types.Message, state: FSMContext):
             if employees:
                 await message.answer(
                     "⚠️ Сначала выберите ваше имя:",
-                    reply_markup=get_name_keyboard(employees)
+                    reply_markup=get_name_keyboard()
                 )
             else:
                 await message.answer("⚠️ Список сотрудников не загружен. Попробуйте позже.")
@@ -742,16 +804,14 @@ async def cmd_today(message: types.Message, state: FSMContext):
     )
 
     today = moscow_now()  # изменено
-    schedule = excel_parser.get_schedule_for_date(today)
-    all_employees = excel_parser.get_employees()
+    formatted_schedule = render_day_schedule(today, employee_name)
 
     response = f"📅 <b>Расписание на {today.strftime('%d.%m.%Y')} ({_get_weekday(today)})</b>\n\n"
 
-    if not schedule:
+    if not formatted_schedule:
         response += "Нет данных о сменах на сегодня."
     else:
-        formatted_schedule = _format_full_day_schedule(all_employees, schedule, employee_name)
-        response += formatted_schedule if formatted_schedule else "Нет данных о сменах."
+        response += formatted_schedule
 
     await message.answer(response, parse_mode="HTML")
 
@@ -774,7 +834,7 @@ async def cmd_tomorrow(message: types.Message, state: FSMContext):
             if employees:
                 await message.answer(
                     "⚠️ Сначала выберите ваше имя:",
-                    reply_markup=get_name_keyboard(employees)
+                    reply_markup=get_name_keyboard()
                 )
             else:
                 await message.answer("⚠️ Список сотрудников не загружен.")
@@ -788,16 +848,14 @@ async def cmd_tomorrow(message: types.Message, state: FSMContext):
     )
 
     tomorrow = moscow_now() + timedelta(days=1)  # изменено
-    schedule = excel_parser.get_schedule_for_date(tomorrow)
-    all_employees = excel_parser.get_employees()
+    formatted_schedule = render_day_schedule(tomorrow, employee_name)
 
     response = f"📅 <b>Расписание на {tomorrow.strftime('%d.%m.%Y')} ({_get_weekday(tomorrow)})</b>\n\n"
 
-    if not schedule:
+    if not formatted_schedule:
         response += "Нет данных о сменах на завтра."
     else:
-        formatted_schedule = _format_full_day_schedule(all_employees, schedule, employee_name)
-        response += formatted_schedule if formatted_schedule else "Нет данных о сменах."
+        response += formatted_schedule
 
     await message.answer(response, parse_mode="HTML")
 
@@ -820,7 +878,7 @@ async def cmd_week(message: types.Message, state: FSMContext):
             if employees:
                 await message.answer(
                     "⚠️ Сначала выберите ваше имя:",
-                    reply_markup=get_name_keyboard(employees)
+                    reply_markup=get_name_keyboard()
                 )
             else:
                 await message.answer("⚠️ Список сотрудников не загружен.")
@@ -834,26 +892,7 @@ async def cmd_week(message: types.Message, state: FSMContext):
     )
 
     today = moscow_now()  # изменено
-    all_employees = excel_parser.get_employees()
-
-    response = "📅 <b>Расписание на неделю</b>\n\n"
-    weekdays_short = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-    has_data = False
-
-    for i in range(7):
-        date = today + timedelta(days=i)
-        schedule = excel_parser.get_schedule_for_date(date)
-        if schedule:
-            has_data = True
-            response += f"<b>{weekdays_short[date.weekday()]} {date.strftime('%d.%m')}</b>\n"
-            formatted = _format_full_day_schedule(all_employees, schedule, employee_name)
-            response += formatted + "\n\n"
-        else:
-            response += f"<b>{weekdays_short[date.weekday()]} {date.strftime('%d.%m')}</b>\n"
-            response += "   Нет данных\n\n"
-
-    if not has_data:
-        response = "📅 <b>Расписание на неделю</b>\n\nНет данных о сменах на ближайшую неделю."
+    response = render_week_schedule(today, employee_name)
 
     await message.answer(response, parse_mode="HTML")
 
@@ -953,20 +992,32 @@ async def cmd_whoisnow(message: types.Message, state: FSMContext):
         "Запросил текущего дежурного"
     )
 
-    current_employee = excel_parser.get_current_employee()
-
-    if current_employee:
-        response = f"👤 <b>Сейчас на смене:</b>\n\n{current_employee['name']}\n⏰ {current_employee['time']}"
+    now = moscow_now()
+    duty = excel_parser.get_duty_status(now)
+    on_duty = duty['on_duty']
+    next_employee = duty['next']
+
+    if on_duty:
+        # Смены могут перекрываться: показываем всех, кто сейчас на смене
+        holders = "\n\n".join(f"{employee['name']}\n⏰ {employee['time']}" for employee in on_duty)
+        response = f"👤 <b>Сейчас на смене:</b>\n\n{holders}"
     else:
         response = "⚠️ Сейчас никто не дежурит или смена не найдена."
 
+    if next_employee:
+        # Между сменами может быть перерыв: следующий заступает не раньше начала своей смены
+        handover = max(duty['handover'], next_employee['start'])
+        handover_str = handover.strftime('%H:%M')
+        if handover.date() != now.date():
+            handover_str = handover.strftime('%d.%m %H:%M')
+        response += f"\n\n➡️ <b>Далее:</b> {next_employee['name']} с {handover_str}"
+
     await message.answer(response, parse_mode="HTML")
 
 
 @dp.message(Command("stats"))
-async def cmd_stats(message: types.Message, state: FSMContext):
-    user_data = await state.get_data()
-    if user_data.get('is_director'):
+async def cmd_stats(message: types.Message, state: FSMContext, principal: Principal):
+    if principal.is_director:
         await message.answer("⛔ Эта команда предназначена для дежурных.")
         return
     """Команда: статистика за месяц"""
@@ -1008,9 +1059,8 @@ async def cmd_stats(message: types.Message, state: FSMContext):
 
 
 @dp.message(Command("settings"))
-async def cmd_settings(message: types.Message, state: FSMContext):
-    user_data = await state.get_data()
-    if user_data.get('is_director'):
+async def cmd_settings(message: types.Message, state: FSMContext, principal: Principal):
+    if principal.is_director:
         await message.answer("⛔ Эта команда недоступна для руководителей.")
         return
     """Команда: настройки (главное меню настроек)."""
@@ -1045,44 +1095,78 @@ async def cmd_settings(message: types.Message, state: FSMContext):
 # Админские команды
 @dp.message(Command("add"))
 async def cmd_add_user(message: types.Message):
-    """Команда для выдачи доступа"""
+    """Команда для выдачи доступа (одному или сразу нескольким пользователям)"""
     if not access_control.is_admin(message.from_user.id):
         await message.answer("⛔ Эта команда доступна только администратору.")
         return
 
-    parts = message.text.split()
-    if len(parts) != 2:
+    # ID можно перечислить через пробел, запятую или с новой строки
+    parts = message.text.replace(',', ' ').split()
+    if len(parts) < 2:
         await message.answer(
             "❌ <b>Неверный формат команды</b>\n\n"
-            "Используйте: <code>/add [user_id]</code>\n\n"
-            "Пример: <code>/add 123456789</code>",
+            "Используйте: <code>/add [user_id] [user_id ...]</code>\n\n"
+            "Пример: <code>/add 123456789</code> или <code>/add 123456789 987654321</code>",
             parse_mode="HTML"
         )
         return
 
     try:
-        user_id = int(parts[1])
+        user_ids = list(dict.fromkeys(int(part) for part in parts[1:]))
+    except ValueError:
+        await message.answer("❌ User ID должен быть числом")
+        return
 
-        await access_control.grant_access(
-            user_id,
-            f"user_{user_id}",
-            message.from_user.id
-        )
+    try:
+        if len(user_ids) == 1:
+            user_id = user_ids[0]
+            await access_control.grant_access(
+                user_id,
+                f"user_{user_id}",
+                message.from_user.id
+            )
 
-        await message.answer(
-            f"✅ <b>Доступ выдан</b>\n\n"
-            f"Пользователь ID: <code>{user_id}</code>\n"
-            f"Пользователь может начать работу с ботом.",
-            parse_mode="HTML"
-        )
+            await message.answer(
+                f"✅ <b>Доступ выдан</b>\n\n"
+                f"Пользователь ID: <code>{user_id}</code>\n"
+                f"Пользователь может начать работу с ботом.",
+                parse_mode="HTML"
+            )
+        else:
+            # Все ID записываются одной транзакцией; в отличие от grant_access ошибки
+            # БД не глотаются, а откатывают всю пачку
+            try:
+                await access_control.grant_access_many(
+                    [(user_id, f"user_{user_id}") for user_id in user_ids],
+                    message.from_user.id
+                )
+            except Exception as e:
+                logger.error(f"Ошибка выдачи доступа пользователям {user_ids}: {e}")
+                await message.answer(
+                    "❌ <b>Доступ не выдан</b>\n\n"
+                    "Ошибка записи в базу данных, ни один пользователь не добавлен. "
+                    "Попробуйте ещё раз.",
+                    parse_mode="HTML"
+                )
+                return
 
+            ids_text = "\n".join(f"• <code>{user_id}</code>" for user_id in user_ids)
+            await message.answer(
+                f"✅ <b>Доступ выдан пользователям: {len(user_ids)}</b>\n\n"
+                f"{ids_text}\n\n"
+                f"Пользователи могут начать работу с ботом.",
+                parse_mode="HTML"
+            )
+
+        if len(user_ids) == 1:
+            target = f"пользователю ID: {user_ids[0]}"
+        else:
+            target = f"пользователям ID: {', '.join(map(str, user_ids))}"
         await bot_logger.log_action(
             message.from_user.username or str(message.from_user.id),
-            f"👑 [ADMIN] Выдал доступ пользователю ID: {user_id}"
+            f"👑 [ADMIN] Выдал доступ {target}"
         )
 
-    except ValueError:
-        await message.answer("❌ User ID должен быть числом")
     except Exception as e:
         await message.answer(f"❌ Ошибка: {e}")
         logger.error(f"Ошибка выдачи доступа: {e}")
@@ -1301,7 +1385,7 @@ async def cmd_remove_director(message: types.Message):
         logger.error(f"Ошибка снятия руководителя: {e}")
 
 @dp.message(StateFilter(UserStates.main_menu), F.text == "🔔 Напоминание за час")
-async def toggle_remind_hour(message: types.Message, state: FSMContext):
+async def toggle_remind_hour(message: types.Message, state: FSMContext, principal: Principal):
     """Включить/выключить напоминание за час до смены."""
     user_id = message.from_user.id
     settings = await db.get_user_settings(user_id)
@@ -1314,7 +1398,7 @@ async def toggle_remind_hour(message: types.Message, state: FSMContext):
     status = "включено" if new_value else "выключено"
     await message.answer(f"🔔 Напоминание за час до смены теперь <b>{status}</b>.", parse_mode="HTML")
     # Возвращаем в меню настроек
-    await cmd_settings(message, state)
+    await cmd_settings(message, state, principal)
 
 
 @dp.message(StateFilter(UserStates.main_menu), F.text == "📅 Ежедневное напоминание")
@@ -1360,11 +1444,11 @@ async def ask_daily_remind_time(message: types.Message, state: FSMContext):
 
 
 @dp.message(StateFilter(UserStates.choosing_daily_remind_time))
-async def set_daily_remind_time(message: types.Message, state: FSMContext):
+async def set_daily_remind_time(message: types.Message, state: FSMContext, principal: Principal):
     """Сохранить выбранное время."""
     if message.text == "◀️ Назад":
         await state.set_state(UserStates.main_menu)
-        await cmd_settings(message, state)
+        await cmd_settings(message, state, principal)
         return
 
     try:
@@ -1374,7 +1458,7 @@ async def set_daily_remind_time(message: types.Message, state: FSMContext):
             await db.update_user_settings(message.from_user.id, daily_remind_time=time_str)
             await message.answer(f"✅ Время ежедневного напоминания установлено на {time_str}.")
             await state.set_state(UserStates.main_menu)
-            await cmd_settings(message, state)
+            await cmd_settings(message, state, principal)
         else:
             await message.answer("❌ Пожалуйста, выберите час от 18 до 23.")
     except ValueError:
@@ -1382,17 +1466,17 @@ async def set_daily_remind_time(message: types.Message, state: FSMContext):
 
 
 @dp.message(StateFilter(UserStates.main_menu), F.text == "Выключить")
-async def disable_daily_remind(message: types.Message, state: FSMContext):
+async def disable_daily_remind(message: types.Message, state: FSMContext, principal: Principal):
     """Выключить ежедневное напоминание."""
     await db.update_user_settings(message.from_user.id, daily_remind_time=None)
     await message.answer("✅ Ежедневные напоминания отключены.")
     await state.set_state(UserStates.main_menu)
-    await cmd_settings(message, state)
+    await cmd_settings(message, state, principal)
 
 
 # Обработчики состояний
 @dp.message(StateFilter(UserStates.choosing_name))
-async def process_name_selection(message: types.Message, state: FSMContext):
+async def process_name_selection(message: types.Message, state: FSMContext, principal: Principal):
     """Обработка выбора имени сотрудника"""
     employees = excel_parser.get_employees()
 
@@ -1422,7 +1506,7 @@ async def process_name_selection(message: types.Message, state: FSMContext):
         await state.set_state(UserStates.main_menu)
 
         # Проверяем, является ли пользователь директором
-        is_director = await access_control.is_director(message.from_user.id)
+        is_director = principal.is_director
 
         await message.answer(
             f"✅ Отлично, {message.text}!\n\n"
@@ -1432,7 +1516,7 @@ async def process_name_selection(message: types.Message, state: FSMContext):
     else:
         await message.answer(
             "⚠️ Пожалуйста, выберите имя из предложенного списка.",
-            reply_markup=get_name_keyboard(employees)
+            reply_markup=get_name_keyboard()
         )
 
 @dp.message(Command("smena"))
@@ -1542,12 +1626,11 @@ async def show_current_shift(message: types.Message, state: FSMContext):
 
 
 @dp.message(StateFilter(UserStates.main_menu), F.text == "📊 Статистика")
-async def show_stats_button(message: types.Message, state: FSMContext):
-    user_data = await state.get_data()
-    if user_data.get('is_director'):
+async def show_stats_button(message: types.Message, state: FSMContext, principal: Principal):
+    if principal.is_director:
         await message.answer("⛔ Эта функция предназначена для дежурных.")
         return
-    await cmd_stats(message, state)
+    await cmd_stats(message, state, principal)
 
 
 @dp.message(StateFilter(UserStates.main_menu), F.text == "ℹ️ О боте")
@@ -1569,12 +1652,11 @@ async def show_about(message: types.Message):
 
 
 @dp.message(StateFilter(UserStates.main_menu), F.text == "⚙️ Настройки")
-async def show_settings(message: types.Message, state: FSMContext):
-    user_data = await state.get_data()
-    if user_data.get('is_director'):
+async def show_settings(message: types.Message, state: FSMContext, principal: Principal):
+    if principal.is_director:
         await message.answer("⛔ Эта функция предназначена для дежурных.")
         return
-    await cmd_settings(message, state)
+    await cmd_settings(message, state, principal)
 
 
 @dp.message(StateFilter(UserStates.main_menu), F.text == "👤 Изменить имя")
@@ -1589,14 +1671,13 @@ async def change_name_button(message: types.Message, state: FSMContext):
     await state.set_state(UserStates.choosing_name)
     await message.answer(
         "Выберите новое имя из списка:",
-        reply_markup=get_name_keyboard(employees)
+        reply_markup=get_name_keyboard()
     )
 
 
 @dp.message(StateFilter(UserStates.main_menu), F.text == "◀️ Назад в меню")
-async def back_to_menu_button(message: types.Message, state: FSMContext):
-    user_id = message.from_user.id
-    is_director = await access_control.is_director(user_id)
+async def back_to_menu_button(message: types.Message, state: FSMContext, principal: Principal):
+    is_director = principal.is_director
     await message.answer(
         "📋 Главное меню:",
         reply_markup=get_main_menu_keyboard(is_director)
@@ -1620,7 +1701,6 @@ async def _record_hours_and_check_complete(director_id: int, employee_name: str,
         return  # ещё не все ответили
 
     # Все ответили — формируем итоговое сообщение
-    import calendar
     month_name = session['month_name']
     month = session['month']
     year = session['year']
@@ -1670,9 +1750,9 @@ async def _record_hours_and_check_complete(director_id: int, employee_name: str,
 # ============================================================
 
 @dp.message(StateFilter(UserStates.main_menu), F.text == "📋 Сверка часов")
-async def hours_check_broadcast(message: types.Message, state: FSMContext):
+async def hours_check_broadcast(message: types.Message, state: FSMContext, principal: Principal):
     user_id = message.from_user.id
-    is_dir = await access_control.is_director(user_id) or access_control.is_admin(user_id)
+    is_dir = principal.is_director or principal.is_admin
     if not is_dir:
         await message.answer("⛔ Эта функция доступна только руководителям.")
         return
@@ -1777,22 +1857,20 @@ async def hours_check_broadcast(message: types.Message, state: FSMContext):
 
 
 @dp.message(StateFilter(None), F.text)
-async def auto_start(message: types.Message, state: FSMContext):
+async def auto_start(message: types.Message, state: FSMContext, principal: Principal):
     """Автоматический вход для пользователей из БД после перезапуска."""
-    has_access = await access_control.check_access(message.from_user.id)
-    if not has_access:
+    if not principal.has_access:
         return
 
-    is_director = await access_control.is_director(message.from_user.id)
-    if is_director:
+    if principal.is_director:
         await state.update_data(is_director=True)
         await state.set_state(UserStates.main_menu)
         if message.text == "📋 Сверка часов":
-            await hours_check_broadcast(message, state)
+            await hours_check_broadcast(message, state, principal)
         elif message.text == "📊 По сотрудникам":
-            await director_stats_choose_employee(message, state)
+            await director_stats_choose_employee(message, state, principal)
         elif message.text == "📊 Отдел":
-            await department_stats_start(message, state)
+            await department_stats_start(message, state, principal)
         elif message.text == "👥 Кто на смене?":
             await show_current_shift(message, state)
         elif message.text == "📅 Сегодня":
@@ -1808,15 +1886,14 @@ async def auto_start(message: types.Message, state: FSMContext):
             )
         return
 
-    user_data_db = await db.get_user(message.from_user.id)
-    if not user_data_db or not user_data_db.get('employee_name'):
+    if not principal.employee_name:
         await message.answer(
             "👋 Для начала работы используйте /start"
         )
         return
 
     # Восстанавливаем состояние из БД
-    employee_name = user_data_db['employee_name']
+    employee_name = principal.employee_name
     await state.update_data(employee_name=employee_name)
     await state.set_state(UserStates.main_menu)
 
@@ -1830,9 +1907,9 @@ async def auto_start(message: types.Message, state: FSMContext):
     elif message.text == "👥 Кто на смене?":
         await show_current_shift(message, state)
     elif message.text == "📊 Статистика":
-        await cmd_stats(message, state)
+        await cmd_stats(message, state, principal)
     elif message.text == "⚙️ Настройки":
-        await cmd_settings(message, state)
+        await cmd_settings(message, state, principal)
     else:
         await message.answer(
             f"👋 С возвращением, {employee_name}!",
@@ -1847,8 +1924,7 @@ async def process_calendar_navigation(callback: types.CallbackQuery):
     year = int(year_str)
     month = int(month_str)
 
-    available_months = excel_parser.get_available_months()
-    month_exists = any(m['year'] == year and m['month'] == month for m in available_months)
+    month_exists = excel_parser.has_month(year, month)
 
     if not month_exists:
         month_names = {
@@ -1871,13 +1947,12 @@ async def process_calendar_navigation(callback: types.CallbackQuery):
 
 
 @dp.callback_query(F.data.startswith("date:"))
-async def process_date_selection(callback: types.CallbackQuery, state: FSMContext):
+async def process_date_selection(callback: types.CallbackQuery, state: FSMContext, principal: Principal):
     """Обработка выбора даты из календаря"""
     date_str = callback.data.split(":")[1]
     selected_date = datetime.strptime(date_str, "%Y-%m-%d")
 
-    user_id = callback.from_user.id
-    is_director = await access_control.is_director(user_id)
+    is_director = principal.is_director
 
     user_data = await state.get_data()
     employee_name = user_data.get('employee_name')
@@ -1888,11 +1963,7 @@ async def process_date_selection(callback: types.CallbackQuery, state: FSMContex
     )
 
     # Проверяем доступность месяца
-    available_months = excel_parser.get_available_months()
-    month_exists = any(
-        m['year'] == selected_date.year and m['month'] == selected_date.month
-        for m in available_months
-    )
+    month_exists = excel_parser.has_month(selected_date.year, selected_date.month)
 
     if not month_exists:
         month_names = {
@@ -1910,11 +1981,8 @@ async def process_date_selection(callback: types.CallbackQuery, state: FSMContex
         )
         return
 
-    schedule = excel_parser.get_schedule_for_date(selected_date) or []
-    all_employees = excel_parser.get_employees()
-
     response = f"📅 <b>Расписание на {selected_date.strftime('%d.%m.%Y')} ({_get_weekday(selected_date)})</b>\n\n"
-    response += _format_full_day_schedule(all_employees, schedule, employee_name)
+    response += render_day_schedule(selected_date, employee_name)
 
     await callback.message.edit_text(response, parse_mode="HTML")
 
@@ -1926,20 +1994,19 @@ async def process_date_selection(callback: types.CallbackQuery, state: FSMContex
 
 
 @dp.callback_query(F.data == "back_to_menu")
-async def back_to_menu(callback: types.CallbackQuery, state: FSMContext):
+async def back_to_menu(callback: types.CallbackQuery, state: FSMContext, principal: Principal):
     """Возврат в главное меню из календаря"""
     await state.set_state(UserStates.main_menu)
 
     await callback.message.edit_text("Возвращаемся в главное меню...")
-    user_id = callback.from_user.id
-    is_director = await access_control.is_director(user_id)
+    is_director = principal.is_director
     await callback.message.answer(
         "📋 Главное меню:",
         reply_markup=get_main_menu_keyboard(is_director)
     )
 
 @dp.callback_query(F.data.startswith("stats:"))
-async def process_stats_selection(callback: types.CallbackQuery, state: FSMContext):
+async def process_stats_selection(callback: types.CallbackQuery, state: FSMContext, principal: Principal):
     user_data = await state.get_data()
     employee_name = user_data.get('employee_name')
     if not employee_name:
@@ -2002,8 +2069,7 @@ async def process_stats_selection(callback: types.CallbackQuery, state: FSMConte
 
     await state.set_state(UserStates.main_menu)
 
-    user_id = callback.from_user.id
-    is_director = await access_control.is_director(user_id)
+    is_director = principal.is_director
     await callback.message.answer(
         "📋 Главное меню:",
         reply_markup=get_main_menu_keyboard(is_director)
@@ -2330,6 +2396,48 @@ async def hours_check_reminder():
         except Exception as e:
             logger.error(f"Ошибка в hours_check_reminder: {e}")
 
+async def on_excel_changed():
+    """
+    Перечитывает график после изменения Excel-файла и логирует, что изменилось.
+    Возвращает False, если перечитать не удалось: FileWatcher повторит попытку.
+    """
+    previous = excel_parser.snapshot
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    snapshot = await excel_parser.reload_data_async()
+    elapsed = loop.time() - started
+
+    if snapshot is None:
+        await bot_logger.log_action("SYSTEM", f"❌ Не удалось перечитать график ({elapsed:.2f} с)")
+        return False
+    if snapshot is previous:
+        logger.info(f"Файл графика пересохранён без изменений ({elapsed:.2f} с)")
+        return True
+
+    # Тексты старого снимка больше не понадобятся
+    cache_stats = day_render_cache.stats()
+    day_render_cache.clear()
+    week_render_cache.clear()
+
+    if snapshot.changed_sheets is None:
+        sheets_text = "полный парсинг"
+    else:
+        sheets_text = ", ".join(snapshot.changed_sheets) or "-"
+    added = [e for e in snapshot.employees if e not in previous.employees]
+    removed = [e for e in previous.employees if e not in snapshot.employees]
+    details = (
+        f"🔄 График обновлён за {elapsed:.2f} с. Листы: {sheets_text}. "
+        f"Дней с данными: {len(previous.store.day_ordinals)} → {len(snapshot.store.day_ordinals)}. "
+        f"Кэш расписаний: попаданий {cache_stats['hits']}, промахов {cache_stats['misses']}"
+    )
+    if added:
+        details += f". Новые сотрудники: {', '.join(added)}"
+    if removed:
+        details += f". Удалены сотрудники: {', '.join(removed)}"
+    await bot_logger.log_action("SYSTEM", details)
+    return True
+
+
 async def seed_users():
     """Предзаполняет БД заранее известными пользователями, ролями и именами."""
 
@@ -2350,33 +2458,32 @@ async def seed_users():
 
     admin_id = access_control.admin_id
 
-    for user_id, employee_name, role in PREDEFINED_USERS:
-        try:
+    # Все пользователи, доступы и роли записываются одной транзакцией
+    try:
+        async with store.transaction() as tx:
             # Сохраняем в users (имя сотрудника)
-            await db.save_user(
-                user_id=user_id,
-                username=employee_name,
-                is_l15=True,
-                employee_name=employee_name
+            await db.save_users(
+                [(user_id, employee_name, True, employee_name)
+                 for user_id, employee_name, _ in PREDEFINED_USERS],
+                tx=tx
             )
-
             # Выдаём доступ в access_list
-            await access_control.grant_access(
-                user_id=user_id,
-                username=employee_name,
-                granted_by=admin_id
+            await access_control.grant_access_many(
+                [(user_id, employee_name) for user_id, employee_name, _ in PREDEFINED_USERS],
+                granted_by=admin_id,
+                tx=tx
             )
-
             # Назначаем роль директора
-            if role == 'director':
-                await access_control.add_director(user_id, added_by=admin_id)
-
-            logger.info(f"Предзаполнен: {employee_name} (ID: {user_id}, роль: {role})")
-
-        except Exception as e:
-            logger.error(f"Ошибка предзаполнения пользователя {user_id}: {e}")
+            await access_control.add_directors(
+                [user_id for user_id, _, role in PREDEFINED_USERS if role == 'director'],
+                added_by=admin_id,
+                tx=tx
+            )
+    except Exception as e:
+        logger.error(f"Ошибка предзаполнения пользователей: {e}")
+        return
 
-    logger.info("Предзаполнение пользователей завершено.")
+    logger.info(f"Предзаполнение пользователей завершено: {len(PREDEFINED_USERS)}")
 
 async def main():
     """Запуск бота"""
@@ -2389,6 +2496,8 @@ async def main():
     asyncio.create_task(reminder_checker())
     asyncio.create_task(hours_check_reminder())
     asyncio.create_task(shift_counter_updater())
+    excel_watcher = FileWatcher(excel_parser.file_path, on_excel_changed, debounce=EXCEL_RELOAD_DEBOUNCE)
+    asyncio.create_task(excel_watcher.run())
 
     logger.info("Бот запущен")
     admin_info = access_control.get_admin_info()
@@ -2400,6 +2509,9 @@ async def main():
         logger.error(f"Ошибка при работе бота: {e}")
         await bot_logger.log_action("SYSTEM", f"❌ Ошибка: {e}")
     finally:
+        shutdown_process_pool()
+        await storage.close()
+        await store.close()
         await bot.session.close()
 
 def _format_full_day_schedule(all_employees, schedule, highlight_employee=None):
@@ -2430,48 +2542,27 @@ def _format_full_day_schedule(all_employees, schedule, highlight_employee=None):
     shifts_by_employee = {}
 
     for emp, slots in employees_to_show.items():
-        parsed = []
-        for slot in slots:
-            try:
-                start_str, end_str = slot.split('-')
-                start_h, start_m = map(int, start_str.split(':'))
-                end_h, end_m = map(int, end_str.split(':'))
-                # Коррекция если конец на следующий день
-                if end_h < start_h or (end_h == start_h and end_m < start_m):
-                    end_h += 24
-                start_min = start_h * 60 + start_m
-                end_min = end_h * 60 + end_m
-                parsed.append({
-                    'start': start_min,
-                    'end': end_min,
-                    'start_str': start_str,
-                    'end_str': end_str
-                })
-            except:
-                continue
-
+        # Строки времени разбираются один раз на всё время работы бота
+        parsed = [slot for slot in map(parse_slot, slots) if slot is not None]
         if not parsed:
             continue
 
-        parsed.sort(key=lambda x: x['start'])
-        # объединяем последовательные
+        parsed.sort(key=lambda x: x.start_min)
+        # объединяем последовательные: [начало, конец, подпись начала, подпись конца]
         combined = []
-        current = parsed[0].copy()
-        for i in range(1, len(parsed)):
-            if parsed[i]['start'] == current['end']:
-                current['end'] = parsed[i]['end']
-                current['end_str'] = parsed[i]['end_str']
+        current = None
+        for slot in parsed:
+            if current is not None and slot.start_min == current[1]:
+                current[1] = slot.end_min
+                current[3] = slot.end_label
             else:
-                combined.append((current['start_str'], current['end_str']))
-                current = parsed[i].copy()
-        combined.append((current['start_str'], current['end_str']))
+                if current is not None:
+                    combined.append(current)
+                current = [slot.start_min, slot.end_min, slot.start_label, slot.end_label]
+        combined.append(current)
 
         # Формируем строки смен с ведущим нулём
-        if len(combined) == 1:
-            time_str = f"{_pad_hour(combined[0][0])}-{_pad_hour(combined[0][1])}"
-        else:
-            intervals = [f"{_pad_hour(s)}-{_pad_hour(e)}" for s, e in combined]
-            time_str = ", ".join(intervals)
+        time_str = ", ".join(f"{start}-{end}" for _, _, start, end in combined)
 
         shifts_by_employee[emp] = time_str
 
@@ -2487,6 +2578,56 @@ def _format_full_day_schedule(all_employees, schedule, highlight_employee=None):
 
     return "\n".join(result_lines) if result_lines else "Нет данных о сменах."
 
+def render_day_schedule(date, highlight_employee=None):
+    """
+    Текст расписания на день через кэш; пустая строка, если на день нет смен.
+    Сотрудники и смены берутся из одного снимка, его версия входит в ключ кэша.
+    """
+    snapshot = excel_parser.snapshot
+    key = (date.toordinal(), highlight_employee, snapshot.version)
+    return day_render_cache.get_or_render(
+        key,
+        lambda: _format_full_day_schedule(
+            snapshot.employees, snapshot.store.day_entries(date), highlight_employee
+        )
+    )
+
+
+def _format_week_schedule(all_employees, week, highlight_employee=None):
+    """Собирает сообщение «Расписание на неделю» из результата get_week_schedule."""
+    weekdays_short = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+    parts = ["📅 <b>Расписание на неделю</b>\n\n"]
+    has_data = False
+
+    for day in week.values():
+        date = day['date']
+        parts.append(f"<b>{weekdays_short[day['weekday']]} {date.strftime('%d.%m')}</b>\n")
+        if day['schedule']:
+            has_data = True
+            parts.append(_format_full_day_schedule(all_employees, day['schedule'], highlight_employee) + "\n\n")
+        else:
+            parts.append("   Нет данных\n\n")
+
+    if not has_data:
+        return "📅 <b>Расписание на неделю</b>\n\nНет данных о сменах на ближайшую неделю."
+    return "".join(parts)
+
+
+def render_week_schedule(start_date, highlight_employee=None):
+    """
+    Сообщение с расписанием на 7 дней начиная с start_date через кэш.
+    Слоты недели берутся одним запросом к хранилищу, сообщение собирается за один проход.
+    """
+    snapshot = excel_parser.snapshot
+    key = (start_date.toordinal(), highlight_employee, snapshot.version)
+    return week_render_cache.get_or_render(
+        key,
+        lambda: _format_week_schedule(
+            snapshot.employees, excel_parser.get_week_schedule(start_date), highlight_employee
+        )
+    )
+
+
 async def reminder_checker():
     """Фоновая задача: раз в минуту проверяет, кому отправить напоминания."""
     while True:
@@ -2496,8 +2637,8 @@ async def reminder_checker():
             current_hour = now.hour
             current_minute = now.minute
 
-            # Получаем всех пользователей с настройками
-            users = await db.get_all_users_with_settings()
+            # Получаем пользователей с доступом и их настройки
+            users = await db.get_active_users_with_settings()
 
             for user in users:
                 user_id = user['user_id']
@@ -2512,8 +2653,10 @@ async def reminder_checker():
                     if shifts_today:
                         for shift in shifts_today:
                             try:
-                                s_str, e_str = shift['time'].split('-')
-                                s_h, s_m = map(int, s_str.split(':'))
+                                slot = parse_slot(shift['time'])
+                                if slot is None:
+                                    continue
+                                s_h, s_m = divmod(slot.start_min, 60)
                                 # Время начала смены (объединённой)
                                 shift_start = now.replace(hour=s_h, minute=s_m, second=0, microsecond=0)
                                 # Время для напоминания = начало смены минус 1 час
@@ -2540,16 +2683,16 @@ async def reminder_checker():
                 if shifts_today and user_id not in active_shift_counters:
                     for shift in shifts_today:
                         try:
-                            start_str, end_str = shift['time'].split('-')
-                            s_h, s_m = map(int, start_str.split(':'))
-                            e_h, e_m = map(int, end_str.split(':'))
+                            slot = parse_slot(shift['time'])
+                            if slot is None:
+                                continue
 
-                            if now.hour == s_h and now.minute == s_m:
+                            if now.hour * 60 + now.minute == slot.start_min:
                                 shift_start = now.replace(second=0, microsecond=0)
+                                e_h, e_m = divmod(slot.end_min, 60)
                                 shift_end = shift_start.replace(hour=e_h % 24, minute=e_m)
-                                if e_h >= 24 or e_h < s_h:
+                                if slot.crosses_midnight:
                                     shift_end += timedelta(days=1)
-                                    shift_end = shift_end.replace(hour=e_h % 24, minute=e_m)
 
                                 msg = await bot.send_message(
                                     user_id,
@@ -1,89 +1,129 @@
-import aiosqlite
 import logging
+from collections import OrderedDict
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-DB_FILE = 'bot_users.db'
+USER_CACHE_SIZE = 1024  # профилей в памяти; сотрудников отдела заметно меньше
+
+_UPSERT_USER = '''
+    INSERT INTO users (user_id, username, is_l15, employee_name, updated_at)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(user_id) DO UPDATE SET
+        username = excluded.username,
+        is_l15 = excluded.is_l15,
+        employee_name = excluded.employee_name,
+        updated_at = CURRENT_TIMESTAMP
+'''
 
 
 class UserDatabase:
-    def __init__(self, db_path=DB_FILE):
-        self.db_path = db_path
+    def __init__(self, store, cache_size=USER_CACHE_SIZE):
+        self.store = store  # SqliteStore, общий с AccessControl
+        # Профили пользователей (строки users) читаются на каждое сообщение, а меняются
+        # только через save_user/update_employee_name, которые сразу обновляют кэш
+        self.cache_size = cache_size
+        self._profiles = OrderedDict()  # user_id -> dict строки или None, если пользователя нет
+        self._profile_writes = 0  # счётчик записей: чтение, пересёкшееся с записью, не кэшируется
 
     async def init_db(self):
-        """Инициализация БД: создаём таблицы users и user_settings."""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Таблица пользователей
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    is_l15 BOOLEAN,
-                    employee_name TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            # Таблица настроек
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS user_settings (
-                    user_id INTEGER PRIMARY KEY,
-                    remind_before_hour BOOLEAN DEFAULT 0,
-                    daily_remind_time TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-                )
-            ''')
-            await db.commit()
-            logger.info(f"База данных инициализирована: {self.db_path}")
+        """Открывает общее хранилище; таблицы users и user_settings создаются его миграциями."""
+        await self.store.connection()
+        logger.info(f"База данных пользователей готова: {self.store.path}")
+
+    def _remember_profile(self, user_id, profile):
+        self._profiles[user_id] = profile
+        self._profiles.move_to_end(user_id)
+        while len(self._profiles) > self.cache_size:
+            self._profiles.popitem(last=False)
+
+    def _remember_profiles(self, profiles):
+        self._profile_writes += 1
+        for user_id, profile in profiles.items():
+            self._remember_profile(user_id, profile)
+
+    async def _fetch_user(self, db, user_id):
+        async with db.execute(
+            'SELECT * FROM users WHERE user_id = ?', (user_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+    async def _refresh_profile(self, tx, user_id):
+        """
+        Перечитывает строку внутри транзакции записи; в кэш она попадает только после commit,
+        чтобы в нём были те же значения, что в БД.
+        """
+        profile = await self._fetch_user(tx.db, user_id)
+        self._profile_writes += 1
+        tx.on_commit(lambda: self._remember_profiles({user_id: profile}))
 
     async def save_user(self, user_id, username, is_l15, employee_name):
         """Сохранить/обновить пользователя."""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                INSERT INTO users (user_id, username, is_l15, employee_name, updated_at)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ON CONFLICT(user_id) DO UPDATE SET
-                    username = excluded.username,
-                    is_l15 = excluded.is_l15,
-                    employee_name = excluded.employee_name,
-                    updated_at = CURRENT_TIMESTAMP
-            ''', (user_id, username, is_l15, employee_name))
-            await db.commit()
+        async with self.store.transaction() as tx:
+            db = tx.db
+            await db.execute(_UPSERT_USER, (user_id, username, is_l15, employee_name))
+            await self._refresh_profile(tx, user_id)
 
-    async def get_user(self, user_id):
-        """Получить данные пользователя."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                'SELECT * FROM users WHERE user_id = ?', (user_id,)
+    async def save_users(self, users, tx=None):
+        """
+        Сохранить/обновить сразу много пользователей одной транзакцией.
+        users - список кортежей (user_id, username, is_l15, employee_name);
+        tx - внешняя транзакция SqliteStore, если запись должна войти в неё.
+        """
+        users = list(users)
+        if not users:
+            return
+        async with self.store.transaction(tx) as tx:
+            await tx.db.executemany(_UPSERT_USER, users)
+            # Строки перечитываются внутри транзакции, в кэш попадают только после commit
+            user_ids = [user[0] for user in users]
+            placeholders = ', '.join('?' * len(user_ids))
+            async with tx.db.execute(
+                f'SELECT * FROM users WHERE user_id IN ({placeholders})', user_ids
             ) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else None
+                profiles = {row['user_id']: dict(row) for row in await cursor.fetchall()}
+            self._profile_writes += 1
+            tx.on_commit(lambda: self._remember_profiles(profiles))
+
+    async def get_user(self, user_id):
+        """Получить данные пользователя (из кэша профилей, если он там есть)."""
+        if user_id in self._profiles:
+            self._profiles.move_to_end(user_id)
+            profile = self._profiles[user_id]
+            return dict(profile) if profile else None
+
+        writes = self._profile_writes
+        async with self.store.committed_read() as db:
+            profile = await self._fetch_user(db, user_id)
+        if writes == self._profile_writes:
+            self._remember_profile(user_id, profile)
+        return dict(profile) if profile else None
 
     async def update_employee_name(self, user_id, employee_name):
         """Обновить имя сотрудника."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.store.transaction() as tx:
+            db = tx.db
             await db.execute(
                 'UPDATE users SET employee_name = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?',
                 (employee_name, user_id)
             )
-            await db.commit()
+            await self._refresh_profile(tx, user_id)
 
     # Методы для работы с настройками
     async def get_user_settings(self, user_id):
         """Получить настройки пользователя."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                'SELECT * FROM user_settings WHERE user_id = ?', (user_id,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else None
+        db = await self.store.connection()
+        async with db.execute(
+            'SELECT * FROM user_settings WHERE user_id = ?', (user_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
 
     async def update_user_settings(self, user_id, remind_before_hour=None, daily_remind_time=None):
         """Обновить настройки пользователя."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.store.transaction() as tx:
+            db = tx.db
             # Проверяем, есть ли запись
             async with db.execute(
                 'SELECT 1 FROM user_settings WHERE user_id = ?', (user_id,)
@@ -110,27 +150,41 @@ class UserDatabase:
                 ''', (user_id,
                       remind_before_hour if remind_before_hour is not None else 0,
                       daily_remind_time))
-            await db.commit()
 
     async def get_all_users_with_settings(self):
         """Получить всех пользователей с их настройками (для фоновой задачи)."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute('''
-                SELECT u.user_id, u.employee_name, s.remind_before_hour, s.daily_remind_time
-                FROM users u
-                LEFT JOIN user_settings s ON u.user_id = s.user_id
-                WHERE u.employee_name IS NOT NULL
-            ''') as cursor:
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+        db = await self.store.connection()
+        async with db.execute('''
+            SELECT u.user_id, u.employee_name, s.remind_before_hour, s.daily_remind_time
+            FROM users u
+            LEFT JOIN user_settings s ON u.user_id = s.user_id
+            WHERE u.employee_name IS NOT NULL
+        ''') as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def get_active_users_with_settings(self):
+        """
+        Пользователи с именем сотрудника, у которых есть доступ (активный или как у руководителя),
+        вместе с настройками напоминаний - одним запросом по общей БД.
+        """
+        db = await self.store.connection()
+        async with db.execute('''
+            SELECT u.user_id, u.employee_name, s.remind_before_hour, s.daily_remind_time
+            FROM users u
+            LEFT JOIN user_settings s ON u.user_id = s.user_id
+            LEFT JOIN access_list a ON u.user_id = a.user_id
+            WHERE u.employee_name IS NOT NULL
+              AND (a.is_active = 1 OR u.user_id IN (SELECT user_id FROM directors))
+        ''') as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
 
     async def get_all_users(self):
         """Получить всех зарегистрированных пользователей с именами сотрудников."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                'SELECT * FROM users WHERE employee_name IS NOT NULL AND employee_name != ""'
-            ) as cursor:
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
\ No newline at end of file
+        db = await self.store.connection()
+        async with db.execute(
+            'SELECT * FROM users WHERE employee_name IS NOT NULL AND employee_name != ""'
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
\ No newline at end of file
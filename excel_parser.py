@@ -1,23 +1,61 @@
 """
 Модуль для работы с Excel файлом графика смен.
-При инициализации парсит все листы и сохраняет данные в JSON-файл.
+При инициализации парсит все листы и сохраняет данные в двоичный снимок (JSON - по желанию).
 Все последующие запросы обрабатываются из загруженных данных (в памяти).
 """
 import pandas as pd
+import asyncio
 import json
 import logging
 from datetime import datetime, timedelta
 import calendar
+import itertools
 from pathlib import Path
+from types import MappingProxyType
 import time
 import os
+import re
+import hashlib
+import posixpath
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.etree import ElementTree
 
 import pytz  # добавлено для работы с часовыми поясами
+from openpyxl import load_workbook
+
+from binary_snapshot import read_snapshot, write_snapshot
+from schedule_store import ScheduleStore
+from slot_times import MINUTES_PER_DAY
 
 logger = logging.getLogger(__name__)
 
 # ИЗМЕНЕНО: абсолютный путь заменен на относительный
-DATA_FILE = 'schedule_data.json'  # файл будет создаваться в той же директории
+DATA_FILE = 'schedule_data.json'  # необязательная выгрузка в JSON
+SNAPSHOT_FILE = 'schedule_data.bin'  # двоичный снимок, файл будет создаваться в той же директории
+
+
+SERVICE_SHEET = 'Служебный лист 2'  # лист со списком сотрудников
+SKIP_SHEET_MARKERS = ('Служебный', 'Отчет', 'Информация', 'ТИКЕТЫ')
+MONTH_NUMBERS_RU = {
+    'Январь': 1, 'Февраль': 2, 'Март': 3, 'Апрель': 4,
+    'Май': 5, 'Июнь': 6, 'Июль': 7, 'Август': 8,
+    'Сентябрь': 9, 'Октябрь': 10, 'Ноябрь': 11, 'Декабрь': 12
+}
+MONTHS_FROM_YEAR = 2025  # месяцы раньше этого года в меню не показываются
+MONTH_NAMES_RU = {number: name for name, number in MONTH_NUMBERS_RU.items()}
+
+# Разбор частей .xlsx для отпечатков листов
+_NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_SHARED_STRING_RE = re.compile(rb'<si>.*?</si>', re.S)
+_SHARED_REF_RE = re.compile(rb'<c\b[^>]*?\bt="s"[^>]*>(?:<f[^>]*/>|<f[^>]*>.*?</f>)?<v>(\d+)</v>', re.S)
+
+# Пул процессов для параллельного парсинга листов (создаётся по требованию)
+_process_pool = None
+_process_pool_workers = 0
 
 
 def moscow_now():
@@ -26,392 +64,755 @@ def moscow_now():
     return datetime.now(tz).replace(tzinfo=None)
 
 
+def _clock(minute):
+    """Абсолютная минута шкалы дежурств -> "ЧЧ:ММ"."""
+    return f"{minute % MINUTES_PER_DAY // 60:02d}:{minute % 60:02d}"
+
+
+def _minute_to_datetime(minute):
+    """Абсолютная минута шкалы дежурств -> datetime."""
+    day, minute = divmod(minute, MINUTES_PER_DAY)
+    return datetime.fromordinal(day) + timedelta(minutes=minute)
+
+
+def is_streaming_supported(file_path):
+    """Потоковое чтение через openpyxl возможно только для .xlsx/.xlsm."""
+    return Path(file_path).suffix.lower() in ('.xlsx', '.xlsm')
+
+
+def iter_sheets_streaming(file_path, only=None):
+    """
+    Открывает книгу один раз в режиме read-only и отдаёт пары (имя листа, итератор строк).
+    Строки читаются лениво, поэтому стоимость разбора пропорциональна числу строк,
+    а не числу строк, умноженному на число листов. only - множество нужных листов.
+    """
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            if only is not None and ws.title not in only:
+                continue
+            yield ws.title, ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def iter_sheets_pandas(file_path, only=None):
+    """Запасной путь для форматов, которые openpyxl не читает (.xls)."""
+    xl_file = pd.ExcelFile(file_path)
+    for sheet in xl_file.sheet_names:
+        if only is not None and sheet not in only:
+            continue
+        df = xl_file.parse(sheet_name=sheet, header=None)
+        rows = (tuple(None if pd.isna(v) else v for v in row)
+                for row in df.itertuples(index=False, name=None))
+        yield sheet, rows
+
+
+def _zip_part(base, target):
+    """Путь части архива по ссылке из .rels (относительной или абсолютной)."""
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(base, target))
+
+
+def workbook_fingerprints(file_path):
+    """
+    Отпечатки содержимого .xlsx без разбора ячеек.
+
+    .xlsx - это zip: XML каждого листа хэшируется как есть, вместе с текстами
+    из таблицы общих строк, на которые лист ссылается. Возвращает
+    {'styles': sha1 стилей, 'sheets': {имя листа: sha1}} или None для не-zip форматов.
+    """
+    if not zipfile.is_zipfile(file_path):
+        return None
+    with zipfile.ZipFile(file_path) as zf:
+        workbook = ElementTree.fromstring(zf.read('xl/workbook.xml'))
+        rels = ElementTree.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+        targets = {}
+        shared_strings_part = None
+        for rel in rels:
+            target = _zip_part('xl', rel.get('Target'))
+            targets[rel.get('Id')] = target
+            if rel.get('Type', '').endswith('/sharedStrings'):
+                shared_strings_part = target
+
+        shared_strings = []
+        if shared_strings_part:
+            shared_strings = _SHARED_STRING_RE.findall(zf.read(shared_strings_part))
+
+        styles = hashlib.sha1()
+        if 'xl/styles.xml' in zf.namelist():
+            styles.update(zf.read('xl/styles.xml'))
+
+        sheets = {}
+        for sheet in workbook.iter(f'{_NS_MAIN}sheet'):
+            data = zf.read(targets[sheet.get(f'{_NS_REL}id')])
+            digest = hashlib.sha1(data)
+            used = sorted({int(idx) for idx in _SHARED_REF_RE.findall(data)})
+            digest.update(b''.join(shared_strings[idx] for idx in used if idx < len(shared_strings)))
+            sheets[sheet.get('name')] = digest.hexdigest()
+
+    return {'styles': styles.hexdigest(), 'sheets': sheets}
+
+
+def _skip_blank_rows(rows):
+    """Пропускает пустые строки в начале листа (как это делает pandas)."""
+    for row in rows:
+        if any(v is not None and str(v).strip() for v in row):
+            return row
+    return None
+
+
+def read_employees(rows):
+    """Список сотрудников из первой колонки служебного листа (первая строка - заголовок)."""
+    if _skip_blank_rows(rows) is None:
+        return []
+    employees = []
+    for row in rows:
+        if not row or row[0] is None:
+            continue
+        name = str(row[0]).strip()
+        if name:
+            employees.append(name)
+    return employees
+
+
+def sheet_month(sheet):
+    """Возвращает (год, месяц) для листа вида "Февраль 26" или None для служебных листов."""
+    if any(x in sheet for x in SKIP_SHEET_MARKERS):
+        return None
+    parts = sheet.split()
+    if len(parts) != 2:
+        return None
+    month_name, year_short = parts[0], parts[1]
+    if month_name not in MONTH_NUMBERS_RU:
+        return None
+    try:
+        year = 2000 + int(year_short) if len(year_short) == 2 else int(year_short)
+    except ValueError:
+        return None
+    return year, MONTH_NUMBERS_RU[month_name]
+
+
+def find_columns(header):
+    """Индексы колонок (дата, ответственный, время) по строке заголовка или None."""
+    date_col = None
+    emp_col = None
+    time_col = None
+    for idx, col in enumerate(header):
+        if col is None:
+            continue
+        col_lower = str(col).lower()
+        if 'дата' in col_lower:
+            date_col = idx
+        elif 'ответственный' in col_lower:
+            emp_col = idx
+        elif 'время' in col_lower:
+            time_col = idx
+    if date_col is None or emp_col is None or time_col is None:
+        return None
+    return date_col, emp_col, time_col
+
+
+def sheet_to_shifts(rows, columns):
+    """
+    Векторно превращает строки листа в таблицу смен с колонками date, employee, time.
+
+    Дата проставляется только в первой строке дня, поэтому колонка "Дата"
+    протягивается вниз; нераспознанная дата обрывает блок, как и раньше.
+    """
+    date_col, emp_col, time_col = columns
+    width = max(columns) + 1
+    df = pd.DataFrame(
+        [(row[date_col], row[emp_col], row[time_col]) for row in rows if len(row) >= width],
+        columns=['date', 'employee', 'time'],
+        dtype=object,
+    )
+    if df.empty:
+        return pd.DataFrame(columns=['date', 'employee', 'time'])
+
+    # Протягиваем дату: каждая заполненная ячейка открывает новый блок строк
+    has_date = df['date'].notna()
+    parsed = pd.to_datetime(df['date'], errors='coerce', format='mixed')
+    dates = parsed.groupby(has_date.cumsum()).transform('first')
+
+    # Маски валидных ответственных и времени
+    emp_str = df['employee'].astype(str).str.strip()
+    time_str = df['time'].astype(str).str.strip()
+    valid = (
+        dates.notna()
+        & df['employee'].notna()
+        & df['time'].notna()
+        & (emp_str != '')
+        & (time_str != '')
+        & ~emp_str.isin(['nan', 'None', 'Ответственный'])
+        & time_str.str.contains(':', regex=False)
+        & time_str.str.contains('-', regex=False)
+    )
+
+    return pd.DataFrame({
+        'date': dates[valid].dt.strftime('%Y-%m-%d'),
+        'employee': emp_str[valid],
+        'time': time_str[valid],
+    })
+
+
+def merge_shifts(schedule, shifts):
+    """Добавляет смены листа в schedule (ключ - "YYYY-MM-DD") с сохранением порядка строк."""
+    for date_key, day in shifts.groupby('date', sort=False):
+        schedule.setdefault(date_key, []).extend(day[['employee', 'time']].to_dict('records'))
+
+
+def parse_sheets(file_path, only=None):
+    """
+    Читает листы книги (все или только из множества only).
+    Возвращает (список сотрудников или None, если служебный лист не читался,
+    {имя листа: таблица смен или None для листов без смен}).
+    """
+    # Рабочая книга открывается один раз, листы читаются последовательно
+    if is_streaming_supported(file_path):
+        sheets = iter_sheets_streaming(file_path, only)
+    else:
+        sheets = iter_sheets_pandas(file_path, only)
+
+    employees = None
+    parsed = {}
+
+    for sheet, rows in sheets:
+        # Загружаем список сотрудников из листа "Служебный лист 2"
+        if sheet == SERVICE_SHEET:
+            try:
+                employees = read_employees(rows)
+                logger.info(f"Загружено {len(employees)} сотрудников")
+            except Exception as e:
+                logger.error(f"Ошибка загрузки списка сотрудников: {e}")
+                employees = []
+            parsed[sheet] = None
+            continue
+
+        # Служебные листы и листы с нераспознанным месяцем смен не содержат
+        if sheet_month(sheet) is None:
+            parsed[sheet] = None
+            continue
+
+        try:
+            header = next(rows, None)
+            columns = find_columns(header or ())
+            if columns is None:
+                logger.warning(f"В листе {sheet} не найдены нужные колонки, пропускаем")
+                parsed[sheet] = None
+                continue
+            parsed[sheet] = sheet_to_shifts(rows, columns)
+        except Exception as e:
+            # Лист без отпечатка будет перечитан при следующей перезагрузке
+            logger.error(f"Не удалось прочитать лист {sheet}: {e}")
+            continue
+
+    return employees, parsed
+
+
+def _parse_sheet_group(file_path, sheet_names):
+    """Задача процесса пула: книга открывается один раз на всю группу листов."""
+    _, parsed = parse_sheets(file_path, set(sheet_names))
+    return parsed
+
+
+def _get_process_pool(workers):
+    """Пул процессов для парсинга; создаётся при первом обращении и переиспользуется."""
+    global _process_pool, _process_pool_workers
+    if _process_pool is None or _process_pool_workers != workers:
+        shutdown_process_pool()
+        # spawn, а не fork: парсинг запускается из рабочего потока процесса бота с открытыми потоками
+        _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        _process_pool_workers = workers
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """Останавливает пул процессов парсинга (при смене числа процессов или завершении бота)."""
+    global _process_pool, _process_pool_workers
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+    _process_pool = None
+    _process_pool_workers = 0
+
+
+def parse_sheets_parallel(file_path, workers, only=None):
+    """
+    То же, что parse_sheets, но листы месяцев распределяются по процессам пула.
+    Результаты собираются в порядке листов книги, поэтому итог не зависит от порядка
+    завершения процессов. Служебные листы читаются в текущем процессе.
+    """
+    names = workbook_sheet_names(file_path)
+    if only is not None:
+        names = [name for name in names if name in only]
+    month_sheets = [name for name in names if sheet_month(name) is not None]
+    if len(month_sheets) < 2:
+        return parse_sheets(file_path, only)
+
+    # Раскладываем листы по группам по кругу: листы месяцев примерно одного размера
+    group_count = min(workers, len(month_sheets))
+    groups = [month_sheets[i::group_count] for i in range(group_count)]
+    pool = _get_process_pool(workers)
+    futures = [pool.submit(_parse_sheet_group, file_path, group) for group in groups]
+
+    other_sheets = set(names) - set(month_sheets)
+    employees, results = parse_sheets(file_path, other_sheets) if other_sheets else (None, {})
+    for future in futures:
+        results.update(future.result())
+
+    parsed = {name: results[name] for name in names if name in results}
+    return employees, parsed
+
+
+def workbook_sheet_names(file_path):
+    """Имена листов в порядке книги (без чтения ячеек)."""
+    wb = load_workbook(file_path, read_only=True)
+    try:
+        return wb.sheetnames
+    finally:
+        wb.close()
+
+
+class MonthCatalogue:
+    """
+    Неизменяемый каталог месяцев графика: строится один раз на снимок.
+    Ведёт себя как кортеж месяцев (от новых к старым), (год, месяц) in catalogue - за O(1).
+    """
+    __slots__ = ('months', '_keys')
+
+    def __init__(self, day_ordinals):
+        keys = set()
+        for ordinal in day_ordinals:
+            day = datetime.fromordinal(ordinal)
+            if day.year >= MONTHS_FROM_YEAR:
+                keys.add((day.year, day.month))
+        self._keys = frozenset(keys)
+        self.months = tuple(
+            MappingProxyType({
+                'year': year,
+                'month': month,
+                'month_name': MONTH_NAMES_RU[month],
+                'name': f"{MONTH_NAMES_RU[month]} {year}"
+            })
+            for year, month in sorted(keys, reverse=True)
+        )
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self.months)
+
+    def __len__(self):
+        return len(self.months)
+
+    def __getitem__(self, index):
+        return self.months[index]
+
+
+_snapshot_versions = itertools.count(1)
+
+
+class ScheduleSnapshot:
+    """
+    Снимок данных графика: сотрудники, смены по датам и отпечатки листов.
+    После построения не изменяется; ExcelParser подменяет его целиком одним присваиванием.
+    """
+
+    def __init__(self, employees=None, schedule=None, sheets=None, styles_fingerprint=None,
+                 changed_sheets=None, store=None):
+        self.employees = employees or []
+        self._schedule = schedule        # ключ: дата (строка "YYYY-MM-DD"), значение: список смен
+        # Колоночное представление, по которому работают все запросы
+        self.store = store if store is not None else ScheduleStore.from_schedule(schedule or {})
+        self.months = MonthCatalogue(self.store.day_ordinals.tolist())
+        self.sheets = sheets or {}       # ключ: имя листа, значение: {'fingerprint': ..., 'dates': [...]}
+        self.styles_fingerprint = styles_fingerprint
+        self.changed_sheets = changed_sheets  # перечитанные листы; None - полный парсинг или загрузка с диска
+        self.created_at = time.time()
+        self.version = next(_snapshot_versions)  # растёт с каждым новым снимком; ключ для кэшей
+
+    @property
+    def schedule(self):
+        # Для снимка из двоичного файла словарь собирается при первом обращении
+        if self._schedule is None:
+            self._schedule = self.store.to_schedule()
+        return self._schedule
+
+    @classmethod
+    def from_view(cls, view):
+        return cls(
+            employees=view.employees,
+            sheets=view.meta.get('sheets', {}),
+            styles_fingerprint=view.meta.get('styles_fingerprint'),
+            store=view.store,
+        )
+
+
 class ExcelParser:
-    def __init__(self, file_path, json_path=DATA_FILE):
+    def __init__(self, file_path, json_path=None, workers=1, snapshot_path=SNAPSHOT_FILE):
         self.file_path = file_path
-        self.json_path = json_path
-        self.employees = []
-        self.schedule_data = {}      # ключ: дата (строка "YYYY-MM-DD"), значение: список смен
-        self.last_update_time = 0
+        self.snapshot_path = snapshot_path
+        self.json_path = json_path  # если задан, снимок дополнительно выгружается в JSON
+        self.workers = workers  # число процессов для парсинга листов; 1 - в текущем процессе
+        self.snapshot = ScheduleSnapshot()
+        self._reload_lock = None
         self._load_or_parse()
 
+    # Данные всегда берутся из текущего снимка, поэтому сотрудники и смены согласованы
+    @property
+    def employees(self):
+        return self.snapshot.employees
+
+    @property
+    def schedule_data(self):
+        return self.snapshot.schedule
+
+    @property
+    def last_update_time(self):
+        return self.snapshot.created_at
+
     def _load_or_parse(self):
-        """Загружает данные из JSON, если файл существует и не устарел, иначе парсит Excel."""
-        if os.path.exists(self.json_path):
-            # можно добавить проверку по времени изменения файла Excel относительно JSON
-            json_mtime = os.path.getmtime(self.json_path)
+        """Загружает двоичный снимок, если файл существует и не устарел, иначе парсит Excel."""
+        if os.path.exists(self.snapshot_path):
+            snapshot_mtime = os.path.getmtime(self.snapshot_path)
             excel_mtime = os.path.getmtime(self.file_path)
-            if json_mtime > excel_mtime:
-                # JSON свежее Excel, просто загружаем
-                self._load_from_json()
-                logger.info("Данные загружены из JSON-файла")
-                return
-        # Если JSON нет или он устарел, парсим Excel
-        self._parse_all_and_save()
-
-    def _parse_all_and_save(self):
-        """Парсит все листы Excel и сохраняет в JSON."""
-        logger.info("Начинаем полный парсинг Excel файла...")
-        try:
-            xl_file = pd.ExcelFile(self.file_path)
-            all_sheets = xl_file.sheet_names
-
-            # Загружаем список сотрудников из листа "Служебный лист 2"
+            snapshot = self._load_snapshot()
+            if snapshot is not None:
+                self.snapshot = snapshot
+                if snapshot_mtime > excel_mtime:
+                    # Снимок свежее Excel, просто загружаем
+                    return
+        # Excel изменён после сохранения снимка, снимка нет или он не читается: парсим Excel
+        self.reload_data()
+
+    def _parse_sheets(self, only=None):
+        """Читает листы книги: параллельно в пуле процессов, если это включено и имеет смысл."""
+        # В дочерних процессах собственный пул не создаём
+        nested = multiprocessing.parent_process() is not None
+        if self.workers > 1 and not nested and is_streaming_supported(self.file_path):
             try:
-                service_df = pd.read_excel(self.file_path, sheet_name='Служебный лист 2')
-                # Предполагаем, что первая колонка содержит имена
-                first_col = service_df.columns[0]
-                self.employees = service_df[first_col].dropna().tolist()
-                # Очистка от возможных NaN и пустых строк
-                self.employees = [str(e).strip() for e in self.employees if str(e).strip()]
-                logger.info(f"Загружено {len(self.employees)} сотрудников")
-            except Exception as e:
-                logger.error(f"Ошибка загрузки списка сотрудников: {e}")
-                self.employees = []
+                return parse_sheets_parallel(self.file_path, self.workers, only)
+            except BrokenProcessPool as e:
+                logger.error(f"Пул процессов парсинга недоступен, читаем последовательно: {e}")
+                shutdown_process_pool()
+        return parse_sheets(self.file_path, only)
+
+    def _read_fingerprints(self):
+        """Отпечатки листов текущей книги или None, если их не удалось посчитать."""
+        try:
+            return workbook_fingerprints(self.file_path)
+        except Exception as e:
+            logger.warning(f"Не удалось посчитать отпечатки листов: {e}")
+            return None
 
-            # Проходим по всем листам, кроме служебных
-            month_names_ru = {
-                'Январь': 1, 'Февраль': 2, 'Март': 3, 'Апрель': 4,
-                'Май': 5, 'Июнь': 6, 'Июль': 7, 'Август': 8,
-                'Сентябрь': 9, 'Октябрь': 10, 'Ноябрь': 11, 'Декабрь': 12
-            }
+    def _parse_all(self):
+        """Парсит все листы Excel и возвращает новый снимок."""
+        logger.info("Начинаем полный парсинг Excel файла...")
+        started = time.perf_counter()
+        fingerprints = self._read_fingerprints()
+        employees, parsed = self._parse_sheets()
+
+        schedule = {}
+        sheets = {}
+        for sheet, shifts in parsed.items():
+            dates = []
+            if shifts is not None:
+                merge_shifts(schedule, shifts)
+                dates = shifts['date'].unique().tolist()
+            if fingerprints is not None and sheet in fingerprints['sheets']:
+                sheets[sheet] = {'fingerprint': fingerprints['sheets'][sheet], 'dates': dates}
+
+        snapshot = ScheduleSnapshot(
+            employees=employees,
+            schedule=schedule,
+            sheets=sheets,
+            styles_fingerprint=fingerprints['styles'] if fingerprints else None,
+        )
+        logger.info(
+            f"Парсинг завершён за {time.perf_counter() - started:.2f} с. "
+            f"Получено {len(schedule)} дней с данными."
+        )
+        return snapshot
+
+    def _parse_changed_sheets(self, previous):
+        """
+        Перечитывает только листы, чьё содержимое изменилось относительно снимка previous,
+        и возвращает новый снимок. Возвращает previous, если ничего не изменилось,
+        и None, если нужен полный парсинг.
+        """
+        fingerprints = self._read_fingerprints()
+        if fingerprints is None or not previous.sheets:
+            return None
+        if fingerprints['styles'] != previous.styles_fingerprint:
+            # Форматы ячеек влияют на распознавание дат во всех листах
+            return None
 
-            schedule = {}  # временный словарь
-
-            for sheet in all_sheets:
-                # Пропускаем служебные листы
-                if any(x in sheet for x in ['Служебный', 'Отчет', 'Информация', 'ТИКЕТЫ']):
-                    continue
-
-                # Определяем месяц и год из названия листа (например, "Февраль 26")
-                parts = sheet.split()
-                if len(parts) != 2:
-                    continue
-                month_name, year_short = parts[0], parts[1]
-                if month_name not in month_names_ru:
-                    continue
-                month_num = month_names_ru[month_name]
-                try:
-                    year = 2000 + int(year_short) if len(year_short) == 2 else int(year_short)
-                except:
-                    continue
-
-                # Читаем лист
-                try:
-                    df = pd.read_excel(self.file_path, sheet_name=sheet)
-                except Exception as e:
-                    logger.error(f"Не удалось прочитать лист {sheet}: {e}")
-                    continue
-
-                # Определяем колонки (предполагаем, что они называются стандартно)
-                date_col = None
-                emp_col = None
-                time_col = None
-                for col in df.columns:
-                    col_lower = str(col).lower()
-                    if 'дата' in col_lower:
-                        date_col = col
-                    elif 'ответственный' in col_lower:
-                        emp_col = col
-                    elif 'время' in col_lower:
-                        time_col = col
-
-                if not date_col or not emp_col or not time_col:
-                    logger.warning(f"В листе {sheet} не найдены нужные колонки, пропускаем")
-                    continue
-
-                # Проходим по строкам
-                current_date = None
-                for idx, row in df.iterrows():
-                    # Проверяем дату
-                    date_val = row.get(date_col)
-                    if pd.notna(date_val):
-                        # преобразуем в datetime, если возможно
-                        if isinstance(date_val, datetime):
-                            current_date = date_val
-                        elif isinstance(date_val, pd.Timestamp):
-                            current_date = date_val.to_pydatetime()
-                        else:
-                            # попытка распарсить строку
-                            try:
-                                current_date = pd.to_datetime(date_val).to_pydatetime()
-                            except:
-                                current_date = None
-
-                    if current_date is None:
-                        continue
-
-                    # Проверяем, что есть ответственный и время
-                    emp_val = row.get(emp_col)
-                    time_val = row.get(time_col)
-                    if pd.isna(emp_val) or pd.isna(time_val):
-                        continue
-
-                    emp_str = str(emp_val).strip()
-                    time_str = str(time_val).strip()
-                    if not emp_str or not time_str or emp_str in ('nan', 'None', 'Ответственный'):
-                        continue
-                    if ':' not in time_str or '-' not in time_str:
-                        continue
-
-                    # Формируем ключ даты
-                    date_key = current_date.strftime('%Y-%m-%d')
-                    if date_key not in schedule:
-                        schedule[date_key] = []
-                    schedule[date_key].append({
-                        'employee': emp_str,
-                        'time': time_str
-                    })
-
-            self.schedule_data = schedule
-            # Сохраняем в JSON
-            with open(self.json_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'employees': self.employees,
-                    'schedule': self.schedule_data
-                }, f, ensure_ascii=False, indent=2)
-            self.last_update_time = time.time()
-            logger.info(f"Парсинг завершён. Сохранено {len(self.schedule_data)} дней с данными.")
+        current = fingerprints['sheets']
+        changed = [name for name, fp in current.items()
+                   if previous.sheets.get(name, {}).get('fingerprint') != fp]
+        removed = [name for name in previous.sheets if name not in current]
+
+        if not changed and not removed:
+            logger.info("Содержимое листов Excel не изменилось")
+            return previous
+
+        started = time.perf_counter()
+        employees, parsed = self._parse_sheets(only=set(changed))
+
+        # Даты, принадлежащие неизменённым листам, трогать нельзя
+        stale = set(changed) | set(removed)
+        kept_dates = set()
+        for name, meta in previous.sheets.items():
+            if name not in stale:
+                kept_dates.update(meta['dates'])
+        old_dates = set()
+        for name in stale:
+            old_dates.update(previous.sheets.get(name, {}).get('dates', []))
+        new_dates = set()
+        for shifts in parsed.values():
+            if shifts is not None:
+                new_dates.update(shifts['date'].unique())
+        if (old_dates | new_dates) & kept_dates:
+            # Один день встречается в нескольких листах: порядок смен сохранит только полный парсинг
+            logger.info("Изменённые листы пересекаются по датам с другими, нужен полный парсинг")
+            return None
 
+        schedule = {key: day for key, day in previous.schedule.items() if key not in old_dates}
+        sheets = {name: meta for name, meta in previous.sheets.items() if name not in stale}
+        for sheet, shifts in parsed.items():
+            dates = []
+            if shifts is not None:
+                merge_shifts(schedule, shifts)
+                dates = shifts['date'].unique().tolist()
+            sheets[sheet] = {'fingerprint': current[sheet], 'dates': dates}
+
+        snapshot = ScheduleSnapshot(
+            employees=employees if employees is not None else previous.employees,
+            schedule=schedule,
+            sheets=sheets,
+            styles_fingerprint=previous.styles_fingerprint,
+            changed_sheets=sorted(stale),
+        )
+        logger.info(
+            f"Инкрементальный парсинг завершён за {time.perf_counter() - started:.2f} с. "
+            f"Перечитаны листы: {', '.join(changed) or '-'}; удалены: {', '.join(removed) or '-'}."
+        )
+        return snapshot
+
+    def build_snapshot(self, previous=None):
+        """
+        Строит новый полный снимок из Excel (инкрементально, если возможно) и сохраняет его на диск.
+        Текущий снимок парсера не меняется, поэтому метод можно вызывать из рабочего потока.
+        """
+        previous = previous if previous is not None else self.snapshot
+        try:
+            snapshot = self._parse_changed_sheets(previous)
         except Exception as e:
-            logger.error(f"Ошибка при парсинге Excel: {e}")
-            # Если не удалось, пытаемся загрузить из JSON (если есть)
-            if os.path.exists(self.json_path):
-                self._load_from_json()
-
-    def _load_from_json(self):
-        """Загружает данные из JSON-файла."""
+            logger.error(f"Ошибка инкрементального парсинга Excel: {e}")
+            snapshot = None
+        if snapshot is None:
+            snapshot = self._parse_all()
+
+        if snapshot is previous:
+            # Книгу пересохранили без изменений: обновляем время снимка, чтобы не считать заново
+            if os.path.exists(self.snapshot_path):
+                os.utime(self.snapshot_path)
+                return snapshot
+        # Ошибка записи на диск не должна отменять уже построенный снимок
         try:
-            with open(self.json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            self.employees = data.get('employees', [])
-            self.schedule_data = data.get('schedule', {})
-            self.last_update_time = time.time()
-            logger.info(f"Данные загружены из {self.json_path}")
+            self._save_snapshot(snapshot)
         except Exception as e:
-            logger.error(f"Ошибка загрузки из JSON: {e}")
-            self.employees = []
-            self.schedule_data = {}
+            logger.error(f"Ошибка сохранения снимка {self.snapshot_path}: {e}")
+        if self.json_path:
+            try:
+                self.export_json(snapshot)
+            except Exception as e:
+                logger.error(f"Ошибка выгрузки графика в JSON: {e}")
+        return snapshot
+
+    def _save_snapshot(self, snapshot):
+        """Атомарно сохраняет снимок расписания и отпечатки листов в двоичный файл."""
+        write_snapshot(self.snapshot_path, snapshot.store, snapshot.employees, {
+            'styles_fingerprint': snapshot.styles_fingerprint,
+            'sheets': snapshot.sheets
+        })
+
+    def _load_snapshot(self):
+        """Загружает снимок из двоичного файла; None, если файл повреждён или другой версии."""
+        try:
+            snapshot = ScheduleSnapshot.from_view(read_snapshot(self.snapshot_path))
+            logger.info(f"Данные загружены из {self.snapshot_path}")
+            return snapshot
+        except Exception as e:
+            logger.error(f"Ошибка загрузки снимка: {e}")
+            return None
+
+    def export_json(self, snapshot=None, json_path=None):
+        """Атомарно выгружает снимок расписания и отпечатки листов в JSON."""
+        snapshot = snapshot if snapshot is not None else self.snapshot
+        json_path = json_path or self.json_path or DATA_FILE
+        tmp_path = f"{json_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'employees': snapshot.employees,
+                'schedule': snapshot.schedule,
+                'styles_fingerprint': snapshot.styles_fingerprint,
+                'sheets': snapshot.sheets
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, json_path)
 
     def reload_data(self):
-        """Принудительная перезагрузка данных из Excel."""
-        self._parse_all_and_save()
+        """Перезагрузка данных из Excel: перечитываются только изменившиеся листы."""
+        try:
+            self.snapshot = self.build_snapshot()
+        except Exception as e:
+            logger.error(f"Ошибка при парсинге Excel: {e}")
+
+    async def reload_data_async(self):
+        """
+        Перезагрузка без блокировки event loop: снимок строится в рабочем потоке,
+        затем подменяется одним присваиванием. Обработчики видят либо старый,
+        либо новый снимок целиком. Возвращает новый снимок или None при ошибке.
+        """
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            previous = self.snapshot
+            loop = asyncio.get_running_loop()
+            try:
+                snapshot = await loop.run_in_executor(None, self.build_snapshot, previous)
+            except Exception as e:
+                logger.error(f"Ошибка при парсинге Excel: {e}")
+                return None
+            self.snapshot = snapshot
+            return snapshot
 
     def get_employees(self):
         return self.employees
 
     def get_schedule_for_date(self, date):
         """Получает расписание на конкретную дату"""
-        date_key = date.strftime('%Y-%m-%d')
-        return self.schedule_data.get(date_key, [])
+        return self.snapshot.store.day_entries(date)
 
     def get_department_stats(self, year, month):
         """
         Возвращает статистику отдела за указанный месяц, используя уже загруженные данные.
         """
-        from collections import defaultdict
-        import calendar
-
-        # Собираем все даты месяца
         days_in_month = calendar.monthrange(year, month)[1]
-        total_hours_all = 0.0
-        employee_hours = defaultdict(float)
-        unassigned_slots = []  # список (date_str, time_slot)
-
-        # Проходим по всем дням месяца
-        for day in range(1, days_in_month + 1):
-            date = datetime(year, month, day)
-            date_key = date.strftime('%Y-%m-%d')
-            day_schedule = self.schedule_data.get(date_key, [])
-
-            for entry in day_schedule:
-                time_str = entry['time']
-                employee = entry.get('employee')
-
-                # Считаем длительность
-                try:
-                    start_str, end_str = time_str.split('-')
-                    start_h, start_m = map(int, start_str.split(':'))
-                    end_h, end_m = map(int, end_str.split(':'))
-                    if end_h < start_h or (end_h == start_h and end_m < start_m):
-                        end_h += 24
-                    hours = (end_h * 60 + end_m - start_h * 60 - start_m) / 60.0
-                except:
-                    continue
-
-                total_hours_all += hours
-
-                if employee and employee not in ('nan', 'None', ''):
-                    employee_hours[employee] += hours
-                else:
-                    # нет ответственного
-                    date_str = date.strftime('%d.%m')
-                    unassigned_slots.append({
-                        'date': date_str,
-                        'time': time_str
-                    })
-
-        # Округляем
-        total_hours_all = round(total_hours_all, 1)
-        employee_hours = {name: round(h, 1) for name, h in employee_hours.items()}
+        return self.get_department_stats_for_period(datetime(year, month, 1),
+                                                    datetime(year, month, days_in_month))
 
+    def get_department_stats_for_period(self, first_date, last_date):
+        """
+        Статистика отдела за произвольный период (даты включительно, хоть за несколько лет):
+        часы всего и по сотрудникам, незанятые слоты и покрытие по дням.
+        """
+        stats = self.snapshot.store.period_stats(first_date.toordinal(), last_date.toordinal())
+        unassigned_slots = [
+            {'date': datetime.fromordinal(ordinal).strftime('%d.%m'), 'time': time_str}
+            for ordinal, time_str in stats['unassigned']
+        ]
+        daily_coverage = [
+            {
+                'date': datetime.fromordinal(ordinal).strftime('%d.%m'),
+                'hours': round(hours, 1),
+                'unassigned_hours': round(unassigned, 1),
+            }
+            for ordinal, hours, unassigned in zip(stats['day_ordinals'].tolist(),
+                                                  stats['day_hours'].tolist(),
+                                                  stats['day_unassigned'].tolist())
+        ]
         return {
-            'total_hours': total_hours_all,
-            'employee_hours': employee_hours,
-            'unassigned_slots': unassigned_slots
+            'total_hours': round(stats['total_hours'], 1),
+            'employee_hours': {name: round(h, 1) for name, h in stats['employee_hours'].items()},
+            'unassigned_slots': unassigned_slots,
+            'daily_coverage': daily_coverage,
         }
 
     def get_employee_schedule(self, employee_name, date):
         """Возвращает список смен сотрудника на дату (объединённых)."""
-        day_schedule = self.get_schedule_for_date(date)
-        if not day_schedule:
+        store = self.snapshot.store
+        emp_id = store.employee_id(employee_name)
+        if emp_id is None:
             return None
-        slots = [entry['time'] for entry in day_schedule if entry['employee'] == employee_name]
-        if not slots:
+        combined = store.merged_shifts(emp_id, date)
+        if not combined:
             return None
-        # Объединяем последовательные слоты
-        parsed = []
-        for slot in slots:
-            try:
-                start_str, end_str = slot.split('-')
-                start_h, start_m = map(int, start_str.split(':'))
-                end_h, end_m = map(int, end_str.split(':'))
-                if end_h < start_h or (end_h == start_h and end_m < start_m):
-                    end_h += 24
-                start_min = start_h * 60 + start_m
-                end_min = end_h * 60 + end_m
-                parsed.append({
-                    'start': start_min,
-                    'end': end_min,
-                    'start_str': start_str,
-                    'end_str': end_str
-                })
-            except:
-                continue
-        if not parsed:
-            return None
-        parsed.sort(key=lambda x: x['start'])
-        # объединение
-        combined = []
-        current = parsed[0].copy()
-        for i in range(1, len(parsed)):
-            if parsed[i]['start'] == current['end']:
-                current['end'] = parsed[i]['end']
-                current['end_str'] = parsed[i]['end_str']
-            else:
-                combined.append((current['start_str'], current['end_str']))
-                current = parsed[i].copy()
-        combined.append((current['start_str'], current['end_str']))
-
-        result = []
-        for i, (s, e) in enumerate(combined, 1):
-            result.append({
-                'shift_number': i,
-                'time': f"{s}-{e}"
-            })
-        return result
+        return [
+            {'shift_number': i, 'time': f"{s}-{e}"}
+            for i, (_, _, s, e) in enumerate(combined, 1)
+        ]
 
-    def get_current_employee(self):
-        """Определяет текущего дежурного с учётом объединения всех его смен на день."""
-        now = moscow_now()  # изменено
-        day_schedule = self.get_schedule_for_date(now)
-        if not day_schedule:
-            return None
+    def get_duty_status(self, now=None):
+        """
+        Текущие и следующий дежурный и время передачи смены.
+        Смены через полночь учитываются: в 01:00 дежурит тот, кто заступил вчера в 22:00.
+        При перекрытии смен on_duty содержит всех, кто на смене (по времени начала),
+        current - первого из них, handover - ближайшее окончание их смен.
+        """
+        now = now or moscow_now()  # изменено
+        store = self.snapshot.store
+        minute = now.toordinal() * MINUTES_PER_DAY + now.hour * 60 + now.minute
+        current, following, handover = store.duty_at(minute)
+
+        def describe(i):
+            if i is None:
+                return None
+            start, end = store.timeline_starts[i], store.timeline_ends[i]
+            return {
+                'name': store.names[store.timeline_emps[i]],
+                'time': f"{_clock(start)}-{_clock(end)}",
+                'start': _minute_to_datetime(start),
+                'end': _minute_to_datetime(end),
+            }
 
-        # Уникальные имена сотрудников, работающих сегодня
-        employees_today = set(entry['employee'] for entry in day_schedule)
-        current_minutes = now.hour * 60 + now.minute
+        on_duty = [describe(i) for i in current]
+        return {
+            'current': on_duty[0] if on_duty else None,
+            'on_duty': on_duty,
+            'next': describe(following),
+            'handover': _minute_to_datetime(handover) if handover is not None else None,
+        }
 
-        for emp in employees_today:
-            shifts = self.get_employee_schedule(emp, now)  # уже объединённые смены
-            if not shifts:
-                continue
-            for shift in shifts:
-                try:
-                    start_str, end_str = shift['time'].split('-')
-                    start_h, start_m = map(int, start_str.split(':'))
-                    end_h, end_m = map(int, end_str.split(':'))
-                    start_min = start_h * 60 + start_m
-                    end_min = end_h * 60 + end_m
-                    if start_min <= current_minutes < end_min:
-                        # Форматируем время с ведущим нулём
-                        formatted_time = f"{start_h:02d}:{start_m:02d}-{end_h:02d}:{end_m:02d}"
-                        return {'name': emp, 'time': formatted_time}
-                except:
-                    continue
-        return None
+    def get_current_employee(self):
+        """Определяет текущего дежурного с учётом объединения всех его смен, в том числе через полночь."""
+        return self.get_duty_status()['current']
 
     def get_available_months(self):
-        """Возвращает список доступных месяцев (только с 2025 года)."""
-        months_set = set()
-        for date_key in self.schedule_data.keys():
-            try:
-                dt = datetime.strptime(date_key, '%Y-%m-%d')
-                # Добавляем только если год >= 2025
-                if dt.year >= 2025:
-                    months_set.add((dt.year, dt.month))
-            except:
-                continue
-        months = []
-        month_names_ru = {
-            1: 'Январь', 2: 'Февраль', 3: 'Март', 4: 'Апрель',
-            5: 'Май', 6: 'Июнь', 7: 'Июль', 8: 'Август',
-            9: 'Сентябрь', 10: 'Октябрь', 11: 'Ноябрь', 12: 'Декабрь'
-        }
-        for year, month in sorted(months_set, reverse=True):
-            months.append({
-                'year': year,
-                'month': month,
-                'month_name': month_names_ru[month],
-                'name': f"{month_names_ru[month]} {year}"
-            })
-        return months
+        """
+        Возвращает доступные месяцы (только с 2025 года), от новых к старым.
+        Каталог строится один раз на снимок; элементы - словари только для чтения.
+        """
+        return self.snapshot.months
+
+    def has_month(self, year, month):
+        """Есть ли в графике данные за месяц."""
+        return (year, month) in self.snapshot.months
 
     def get_employee_stats_for_month(self, employee_name, year, month):
-        """Статистика за месяц."""
+        """Статистика за месяц: суммы берутся из префиксных сумм хранилища."""
         days_in_month = calendar.monthrange(year, month)[1]
-        total_hours = 0
-        worked_days = set()
         now = moscow_now()  # изменено
+        store = self.snapshot.store
+        emp_id = store.employee_id(employee_name)
+        first = datetime(year, month, 1).toordinal()
 
-        for day in range(1, days_in_month + 1):
-            date = datetime(year, month, day)
-            shifts = self.get_employee_schedule(employee_name, date)
-            if shifts:
-                worked_days.add(day)
-                for shift in shifts:
-                    try:
-                        start_str, end_str = shift['time'].split('-')
-                        start_h, start_m = map(int, start_str.split(':'))
-                        end_h, end_m = map(int, end_str.split(':'))
-                        if end_h < start_h or (end_h == start_h and end_m < start_m):
-                            end_h += 24
-                        hours = (end_h * 60 + end_m - start_h * 60 - start_m) / 60
-                        total_hours += hours
-                    except:
-                        continue
+        def hours(end_ordinal):
+            """Часы и рабочие дни с 1-го числа по end_ordinal не включая."""
+            if emp_id is None:
+                return 0, 0
+            return store.employee_month_totals(emp_id, first, end_ordinal)
+
+        total_hours, worked_days = hours(first + days_in_month)
 
         # Расчет отработанных часов
         if year < now.year or (year == now.year and month < now.month):
             worked_hours = total_hours
             remaining_hours = 0
         elif year == now.year and month == now.month:
-            worked_hours = 0
-            for day in range(1, now.day):
-                date = datetime(year, month, day)
-                shifts = self.get_employee_schedule(employee_name, date)
-                if shifts:
-                    for shift in shifts:
-                        try:
-                            start_str, end_str = shift['time'].split('-')
-                            start_h, start_m = map(int, start_str.split(':'))
-                            end_h, end_m = map(int, end_str.split(':'))
-                            if end_h < start_h or (end_h == start_h and end_m < start_m):
-                                end_h += 24
-                            hours = (end_h * 60 + end_m - start_h * 60 - start_m) / 60
-                            worked_hours += hours
-                        except:
-                            continue
+            worked_hours, _ = hours(first + now.day - 1)
             remaining_hours = max(0, total_hours - worked_hours)
         else:
             worked_hours = 0
@@ -421,13 +822,16 @@ class ExcelParser:
             'total_hours': round(total_hours, 1),
             'worked_hours': round(worked_hours, 1),
             'remaining_hours': round(remaining_hours, 1),
-            'worked_days': len(worked_days),
+            'worked_days': worked_days,
             'salary': round(total_hours * 160),
             'earned_salary': round(worked_hours * 160)
         }
 
     def get_week_schedule(self, start_date, employee_name=None):
-        """Расписание на неделю (7 дней)."""
+        """Расписание на неделю (7 дней): все слоты недели берутся одним запросом к хранилищу."""
+        store = self.snapshot.store
+        first = start_date.toordinal()
+        days = store.period_entries(first, first + 6) if not employee_name else None
         week = {}
         for i in range(7):
             date = start_date + timedelta(days=i)
@@ -435,7 +839,7 @@ class ExcelParser:
             if employee_name:
                 shifts = self.get_employee_schedule(employee_name, date)
             else:
-                shifts = self.get_schedule_for_date(date)
+                shifts = days.get(first + i, [])
             week[date_key] = {
                 'date': date,
                 'weekday': date.weekday(),
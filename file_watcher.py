@@ -0,0 +1,163 @@
+"""
+Модуль слежения за файлом графика.
+На Linux использует inotify (через libc, без сторонних зависимостей),
+в остальных случаях опрашивает время изменения файла.
+Серии записей от редакторов и синхронизаторов схлопываются в одно событие.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEBOUNCE = 3.0       # секунд тишины после последней записи
+DEFAULT_POLL_INTERVAL = 5.0  # период опроса, если inotify недоступен
+DEFAULT_RETRIES = 3          # повторов обработки той же версии файла, если on_change не удался
+
+# Константы и формат события из <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class FileWatcher:
+    """Следит за одним файлом и вызывает on_change после затишья в debounce секунд."""
+
+    def __init__(self, path, on_change, debounce=DEFAULT_DEBOUNCE, poll_interval=DEFAULT_POLL_INTERVAL,
+                 retries=DEFAULT_RETRIES):
+        self.path = os.path.abspath(path)
+        # Корутина без аргументов; исключение или результат False - изменение не обработано
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.retries = retries
+        self._dirty = None
+        self._inotify_fd = None
+        self._last_signature = self._signature()
+
+    def _signature(self):
+        """Время изменения и размер файла или None, если файла сейчас нет."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _start_inotify(self):
+        """Подписывается на события каталога файла. Возвращает False, если inotify недоступен."""
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_init1')
+            # Следим за каталогом: редакторы часто пишут во временный файл и переименовывают его
+            directory = os.path.dirname(self.path).encode()
+            mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+            if libc.inotify_add_watch(fd, directory, mask) < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), 'inotify_add_watch')
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify недоступен, переходим на опрос файла: {e}")
+            return False
+
+        self._inotify_fd = fd
+        asyncio.get_running_loop().add_reader(fd, self._read_inotify_events)
+        return True
+
+    def _read_inotify_events(self):
+        """Разбирает накопившиеся события inotify и отмечает изменение нужного файла."""
+        try:
+            data = os.read(self._inotify_fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        filename = os.path.basename(self.path).encode()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            name_start = offset + _EVENT_HEADER.size
+            name = data[name_start:name_start + name_len].rstrip(b'\0')
+            offset = name_start + name_len
+            if name == filename:
+                self._dirty.set()
+
+    def _stop_inotify(self):
+        if self._inotify_fd is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify_fd)
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    async def _poll(self):
+        """Запасной режим: периодически сравнивает время изменения и размер файла."""
+        seen = self._last_signature
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            signature = self._signature()
+            if signature != seen:
+                seen = signature
+                self._dirty.set()
+
+    async def _wait_quiet(self):
+        """Ждёт, пока в течение debounce секунд не будет новых событий."""
+        while True:
+            self._dirty.clear()
+            try:
+                await asyncio.wait_for(self._dirty.wait(), self.debounce)
+            except asyncio.TimeoutError:
+                return
+
+    async def run(self):
+        """Фоновая задача слежения за файлом."""
+        self._dirty = asyncio.Event()
+        poller = None
+        if self._start_inotify():
+            logger.info(f"Слежение за {self.path} через inotify (debounce {self.debounce} с)")
+        else:
+            poller = asyncio.create_task(self._poll())
+            logger.info(f"Слежение за {self.path} опросом раз в {self.poll_interval} с")
+
+        failures = 0
+        try:
+            while True:
+                await self._dirty.wait()
+                await self._wait_quiet()
+
+                signature = self._signature()
+                if signature is None or signature == self._last_signature:
+                    # Файл удалён посреди записи или фактически не менялся
+                    continue
+
+                try:
+                    handled = await self.on_change() is not False
+                except Exception as e:
+                    logger.error(f"Ошибка обработки изменения {self.path}: {e}")
+                    handled = False
+                if handled:
+                    # Версия считается обработанной только после успешного on_change
+                    self._last_signature = signature
+                    failures = 0
+                    continue
+
+                # Файл мог быть пойман недописанным: повторяем после debounce, пока есть попытки.
+                # _last_signature не меняем, чтобы следующее событие снова вызвало обработку
+                failures += 1
+                if failures <= self.retries:
+                    logger.warning(f"Повторная обработка {self.path} через {self.debounce} с "
+                                   f"(попытка {failures} из {self.retries})")
+                    self._dirty.set()
+                else:
+                    logger.error(f"Не удалось обработать {self.path}, ждём следующего изменения")
+                    failures = 0
+        finally:
+            if poller is not None:
+                poller.cancel()
+            self._stop_inotify()
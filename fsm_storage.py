@@ -0,0 +1,181 @@
+"""
+Хранилище состояний FSM в общей SQLite-базе бота (таблица fsm_state).
+
+Чтение идёт из кэша в памяти; запись только помечает запись изменённой,
+а в БД изменения уходят пачкой раз в flush_interval секунд: несколько
+update_data подряд дают одну строку в одной транзакции. Кэш ограничен по
+числу пользователей и времени простоя - вытесняются только уже записанные
+в БД состояния, поэтому после перезапуска бот продолжает с того же места.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+logger = logging.getLogger(__name__)
+
+FSM_FLUSH_INTERVAL = 1.0   # секунд между сбросами изменений в БД
+FSM_CACHE_SIZE = 2048      # состояний в памяти
+FSM_IDLE_TTL = 3600        # секунд простоя, после которых состояние выгружается из памяти
+
+_UPSERT_STATE = '''
+    INSERT INTO fsm_state (storage_key, state, data, updated_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(storage_key) DO UPDATE SET
+        state = excluded.state,
+        data = excluded.data,
+        updated_at = CURRENT_TIMESTAMP
+'''
+_DELETE_STATE = 'DELETE FROM fsm_state WHERE storage_key = ?'
+
+
+def _storage_key(key):
+    """Строковый ключ строки таблицы из StorageKey aiogram."""
+    return (f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:"
+            f"{key.business_connection_id or ''}:{key.destiny}")
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'touched')
+
+    def __init__(self, state=None, data=None):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.touched = time.monotonic()
+
+
+class SqliteStorage(BaseStorage):
+    """Постоянное хранилище FSM с кэшем чтения и отложенной пакетной записью."""
+
+    def __init__(self, store, flush_interval=FSM_FLUSH_INTERVAL, cache_size=FSM_CACHE_SIZE,
+                 idle_ttl=FSM_IDLE_TTL):
+        self.store = store  # SqliteStore, общий с UserDatabase и AccessControl
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.idle_ttl = idle_ttl
+        self._records = OrderedDict()  # строковый ключ -> _Record, от давно использованных к недавним
+        self._dirty = set()  # ключи, изменения которых ещё не записаны в БД
+        self._flushing = set()  # ключи, которые сейчас записываются; из памяти их не выгружаем
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._closing = asyncio.Event()  # будит отложенный сброс при остановке
+
+    async def _record(self, key):
+        storage_key = _storage_key(key)
+        record = self._records.get(storage_key)
+        if record is None:
+            db = await self.store.connection()
+            async with db.execute(
+                'SELECT state, data FROM fsm_state WHERE storage_key = ?', (storage_key,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            # Пока шёл запрос, запись могла появиться - она новее строки из БД
+            record = self._records.get(storage_key)
+            if record is None:
+                record = _Record(row[0], json.loads(row[1])) if row else _Record()
+                self._records[storage_key] = record
+                self._evict()
+        self._records.move_to_end(storage_key)
+        record.touched = time.monotonic()
+        return storage_key, record
+
+    def _mark_dirty(self, storage_key):
+        self._dirty.add(storage_key)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        try:
+            await asyncio.wait_for(self._closing.wait(), self.flush_interval)
+        except asyncio.TimeoutError:
+            pass
+        # Изменения, пришедшие во время записи (или после её ошибки), запланируют новый сброс
+        self._flush_task = None
+        await self.flush()
+
+    def _evict(self, now=None):
+        """Выгружает из памяти лишние и давно не использованные состояния, кроме незаписанных."""
+        now = time.monotonic() if now is None else now
+        # Последнее использованное состояние не трогаем: его только что загрузили или изменили
+        for storage_key in list(self._records)[:-1]:
+            record = self._records[storage_key]
+            if len(self._records) <= self.cache_size and now - record.touched < self.idle_ttl:
+                break
+            if storage_key not in self._dirty and storage_key not in self._flushing:
+                del self._records[storage_key]
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            # Пока транзакция ждёт блокировку записи, эти состояния есть только в памяти
+            dirty, self._dirty = self._dirty, set()
+            self._flushing = dirty
+            try:
+                await self._write(dirty)
+            except Exception as e:
+                # Записи остаются в памяти, пока помечены изменёнными; повторим через flush_interval
+                self._dirty |= dirty
+                logger.error(f"Ошибка записи состояний FSM: {e}")
+                if not self._closing.is_set():
+                    self._schedule_flush()
+                return
+            finally:
+                self._flushing = set()
+        self._evict()
+
+    async def _write(self, dirty):
+        upserts, deletes = [], []
+        for storage_key in dirty:
+            record = self._records[storage_key]
+            if record.state is None and not record.data:
+                deletes.append((storage_key,))
+                continue
+            try:
+                data = json.dumps(record.data, ensure_ascii=False)
+            except (TypeError, ValueError) as e:
+                # Повтор не поможет: такое состояние остаётся только в памяти
+                logger.error(f"Состояние FSM {storage_key} не сериализуется в JSON: {e}")
+                continue
+            upserts.append((storage_key, record.state, data))
+        async with self.store.transaction() as tx:
+            if upserts:
+                await tx.db.executemany(_UPSERT_STATE, upserts)
+            if deletes:
+                await tx.db.executemany(_DELETE_STATE, deletes)
+
+    async def set_state(self, key, state=None):
+        storage_key, record = await self._record(key)
+        state = state.state if isinstance(state, State) else state
+        if record.state != state:
+            record.state = state
+            self._mark_dirty(storage_key)
+
+    async def get_state(self, key):
+        _, record = await self._record(key)
+        return record.state
+
+    async def set_data(self, key, data):
+        storage_key, record = await self._record(key)
+        if record.data != data:
+            record.data = data.copy()
+            self._mark_dirty(storage_key)
+
+    async def get_data(self, key):
+        _, record = await self._record(key)
+        return record.data.copy()
+
+    async def close(self):
+        """Дописывает незаписанные изменения при остановке бота."""
+        self._closing.set()
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
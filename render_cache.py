@@ -0,0 +1,49 @@
+"""
+Кэш готовых текстов ответов бота.
+Ключ должен включать версию снимка графика: после перезагрузки старые записи
+перестают совпадать и вытесняются сами, а clear() освобождает их сразу.
+Используется только из event loop, поэтому блокировки не нужны.
+"""
+import time
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 512
+DEFAULT_TTL = 600  # секунд
+
+
+class RenderCache:
+    """LRU-кэш с ограничением числа записей и времени жизни, со счётчиками попаданий."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # ключ -> (срок годности, значение)
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        """Возвращает значение из кэша или вызывает render() и запоминает результат."""
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        value = render()
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """Счётчики для логов: записей, попаданий, промахов."""
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        return len(self._entries)
@@ -38,50 +38,52 @@ def find_excel_file():
     return all_excel[0]
 
 
-# Проверка наличия токена
-bot_token = os.getenv('BOT_TOKEN')
-if not bot_token:
-    print("❌ BOT_TOKEN не задан в переменных окружения!")
-    print("📝 Укажите BOT_TOKEN в переменных окружения на хостинге")
-    sys.exit(1)
-
-# Автоматический поиск Excel файла
-excel_file = os.getenv('EXCEL_FILE')
-if not excel_file:
-    excel_file = find_excel_file()
-    if excel_file:
-        os.environ['EXCEL_FILE'] = excel_file
-        print(f"✅ Автоматически найден файл: {excel_file}")
-    else:
-        print("❌ Не найден ни один Excel файл (.xlsx или .xls) в текущей директории!")
+# Дочерние процессы парсинга (spawn) импортируют этот модуль заново: бот запускается только здесь
+if __name__ == '__main__':
+    # Проверка наличия токена
+    bot_token = os.getenv('BOT_TOKEN')
+    if not bot_token:
+        print("❌ BOT_TOKEN не задан в переменных окружения!")
+        print("📝 Укажите BOT_TOKEN в переменных окружения на хостинге")
         sys.exit(1)
-else:
-    # Проверяем, существует ли указанный файл
-    if not Path(excel_file).exists():
-        print(f"❌ Указанный Excel файл '{excel_file}' не найден!")
-        print("📝 Пробуем найти любой Excel файл...")
 
-        auto_file = find_excel_file()
-        if auto_file:
-            os.environ['EXCEL_FILE'] = auto_file
-            print(f"✅ Используем найденный файл: {auto_file}")
+    # Автоматический поиск Excel файла
+    excel_file = os.getenv('EXCEL_FILE')
+    if not excel_file:
+        excel_file = find_excel_file()
+        if excel_file:
+            os.environ['EXCEL_FILE'] = excel_file
+            print(f"✅ Автоматически найден файл: {excel_file}")
         else:
+            print("❌ Не найден ни один Excel файл (.xlsx или .xls) в текущей директории!")
             sys.exit(1)
+    else:
+        # Проверяем, существует ли указанный файл
+        if not Path(excel_file).exists():
+            print(f"❌ Указанный Excel файл '{excel_file}' не найден!")
+            print("📝 Пробуем найти любой Excel файл...")
 
-print("✅ Все проверки пройдены")
-print("🚀 Запуск бота...")
-print("📊 Используется файл:", os.getenv('EXCEL_FILE'))
-print("💡 Для остановки нажмите Ctrl+C")
-print("-" * 50)
+            auto_file = find_excel_file()
+            if auto_file:
+                os.environ['EXCEL_FILE'] = auto_file
+                print(f"✅ Используем найденный файл: {auto_file}")
+            else:
+                sys.exit(1)
 
-# Запуск бота
-from bot import main
-import asyncio
+    print("✅ Все проверки пройдены")
+    print("🚀 Запуск бота...")
+    print("📊 Используется файл:", os.getenv('EXCEL_FILE'))
+    print("💡 Для остановки нажмите Ctrl+C")
+    print("-" * 50)
 
-try:
-    asyncio.run(main())
-except KeyboardInterrupt:
-    print("\n⏹ Бот остановлен пользователем")
-except Exception as e:
-    print(f"\n❌ Ошибка при работе бота: {e}")
-    sys.exit(1)
\ No newline at end of file
+    # Запуск бота
+    from bot import main
+    import asyncio
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n⏹ Бот остановлен пользователем")
+    except Exception as e:
+        print(f"\n❌ Ошибка при работе бота: {e}")
+        sys.exit(1)
\ No newline at end of file
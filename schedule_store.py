@@ -0,0 +1,316 @@
+"""
+Колоночное хранилище графика смен.
+Каждый слот - строка в параллельных массивах NumPy: порядковый номер даты,
+начало и конец в минутах, номер сотрудника и номер исходной строки времени.
+Слоты упорядочены по дате (внутри дня - в порядке листа), поэтому день и месяц -
+это непрерывные диапазоны, которые находятся по таблице смещений.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date
+from itertools import accumulate
+from operator import itemgetter
+
+import numpy as np
+
+from slot_times import MINUTES_PER_DAY, parse_slot
+
+NO_MINUTES = -1  # строка времени не разобрана
+UNASSIGNED_NAMES = ('nan', 'None', '')  # так в графике выглядит слот без ответственного
+
+
+class ScheduleStore:
+    """Неизменяемое хранилище слотов; строится один раз на снимок."""
+
+    def __init__(self, names, time_labels, dates, starts, ends, emp_ids, time_ids):
+        self.names = names                  # номер сотрудника -> имя
+        self.name_ids = {name: i for i, name in enumerate(names)}
+        # Маска по номеру сотрудника: есть ли у слота ответственный
+        self.assigned = np.array([bool(name) and name not in UNASSIGNED_NAMES for name in names], dtype=bool)
+        self.time_labels = time_labels      # номер строки времени -> "9:00-10:00"
+        # Разобранные строки времени (SlotTime) или None для неразобранных
+        self.time_slots = [parse_slot(label) for label in time_labels]
+        self.dates = dates
+        self.starts = starts
+        self.ends = ends
+        self.emp_ids = emp_ids
+        self.time_ids = time_ids
+
+        # Таблица смещений: day_ordinals[i] занимает слоты day_bounds[i]:day_bounds[i + 1]
+        self.day_ordinals, first = np.unique(dates, return_index=True)
+        self.day_bounds = np.append(first, len(dates))
+        bounds = self.day_bounds.tolist()
+        self._days = {
+            ordinal: (bounds[i], bounds[i + 1])
+            for i, ordinal in enumerate(self.day_ordinals.tolist())
+        }
+        # Объединённые смены: (номер сотрудника, дата) -> ((начало, конец, "9:00", "12:00"), ...)
+        self.shift_index = self._build_shift_index()
+        # Шкала дежурств в абсолютных минутах (дата * 1440 + минуты), по возрастанию начала
+        self.timeline_starts, self.timeline_ends, self.timeline_emps = self._build_timeline()
+        # Максимум концов на префиксе: где останавливать поиск идущих смен
+        self._timeline_reach = list(accumulate(self.timeline_ends, max))
+        # Накопленные по дням часы смен и число рабочих дней каждого сотрудника
+        self._first_ordinal = int(self.day_ordinals[0]) if len(self.day_ordinals) else 0
+        self._cum_hours, self._cum_days = self._build_employee_totals()
+
+    @classmethod
+    def from_schedule(cls, schedule):
+        """Строит хранилище из словаря "YYYY-MM-DD" -> [{'employee', 'time'}]."""
+        names, name_ids = [], {}
+        labels, label_ids = [], {}
+        dates, emp_ids, time_ids = [], [], []
+        for date_key in sorted(schedule):
+            ordinal = date.fromisoformat(date_key).toordinal()
+            for entry in schedule[date_key]:
+                employee = entry['employee']
+                if employee not in name_ids:
+                    name_ids[employee] = len(names)
+                    names.append(employee)
+                time_str = entry['time']
+                if time_str not in label_ids:
+                    label_ids[time_str] = len(labels)
+                    labels.append(time_str)
+                dates.append(ordinal)
+                emp_ids.append(name_ids[employee])
+                time_ids.append(label_ids[time_str])
+
+        time_ids = np.array(time_ids, dtype=np.uint16)
+        minutes = np.array([
+            (slot.start_min, slot.end_min) if slot is not None else (NO_MINUTES, NO_MINUTES)
+            for slot in map(parse_slot, labels)
+        ], dtype=np.int32).reshape(-1, 2)
+        return cls(
+            names, labels,
+            dates=np.array(dates, dtype=np.int32),
+            starts=minutes[time_ids, 0],
+            ends=minutes[time_ids, 1],
+            emp_ids=np.array(emp_ids, dtype=np.uint16),
+            time_ids=time_ids,
+        )
+
+    def __len__(self):
+        return len(self.dates)
+
+    def employee_id(self, name):
+        return self.name_ids.get(name)
+
+    def day_range(self, day):
+        """Диапазон слотов дня (date или datetime); пустой, если дня нет в графике."""
+        return self._days.get(day.toordinal(), (0, 0))
+
+    def period_range(self, first_ordinal, last_ordinal):
+        """Диапазон слотов с first_ordinal по last_ordinal включительно."""
+        lo, hi = np.searchsorted(self.day_ordinals, [first_ordinal, last_ordinal + 1])
+        return int(self.day_bounds[lo]), int(self.day_bounds[hi])
+
+    def day_entries(self, day):
+        """Слоты дня в исходном виде: [{'employee': ..., 'time': ...}]."""
+        lo, hi = self.day_range(day)
+        names = self.names
+        labels = self.time_labels
+        return [
+            {'employee': names[e], 'time': labels[t]}
+            for e, t in zip(self.emp_ids[lo:hi].tolist(), self.time_ids[lo:hi].tolist())
+        ]
+
+    def period_entries(self, first_ordinal, last_ordinal):
+        """Слоты периода одним срезом: {дата: [{'employee', 'time'}]}, только дни со слотами."""
+        lo, hi = self.period_range(first_ordinal, last_ordinal)
+        names = self.names
+        labels = self.time_labels
+        days = {}
+        for ordinal, emp_id, time_id in zip(self.dates[lo:hi].tolist(), self.emp_ids[lo:hi].tolist(),
+                                            self.time_ids[lo:hi].tolist()):
+            days.setdefault(ordinal, []).append({'employee': names[emp_id], 'time': labels[time_id]})
+        return days
+
+    def _build_shift_index(self):
+        """Один проход по слотам: группировка по (сотрудник, дата), сортировка и объединение."""
+        groups = {}
+        for ordinal, start, end, emp_id, time_id in zip(
+                self.dates.tolist(), self.starts.tolist(), self.ends.tolist(),
+                self.emp_ids.tolist(), self.time_ids.tolist()):
+            if start != NO_MINUTES:
+                groups.setdefault((emp_id, ordinal), []).append((start, end, time_id))
+
+        index = {}
+        for key, slots in groups.items():
+            slots.sort(key=itemgetter(0))
+            combined = []
+            current = None
+            for start, end, time_id in slots:
+                slot = self.time_slots[time_id]
+                if current is not None and start == current[1]:
+                    current[1] = end
+                    current[3] = slot.end_str
+                else:
+                    if current is not None:
+                        combined.append(tuple(current))
+                    current = [start, end, slot.start_str, slot.end_str]
+            combined.append(tuple(current))
+            index[key] = tuple(combined)
+        return index
+
+    def _build_timeline(self):
+        """Объединённые смены всех сотрудников; смены, продолжающиеся после полуночи, склеиваются."""
+        intervals = []
+        last = {}  # сотрудник -> его последний интервал
+        for (emp_id, ordinal), shifts in sorted(self.shift_index.items()):
+            base = ordinal * MINUTES_PER_DAY
+            for start, end, _, _ in shifts:
+                start, end = base + start, base + end
+                interval = last.get(emp_id)
+                if interval is not None and start <= interval[1]:
+                    interval[1] = max(interval[1], end)
+                else:
+                    last[emp_id] = interval = [start, end, emp_id]
+                    intervals.append(interval)
+        intervals.sort(key=itemgetter(0))
+        return ([i[0] for i in intervals], [i[1] for i in intervals], [i[2] for i in intervals])
+
+    def _build_employee_totals(self):
+        """
+        Накопленные суммы по дням для каждого сотрудника:
+        _cum_hours[сотрудник, k] - часы с 1-го числа месяца по день first_ordinal + k - 1 включительно,
+        _cum_days[сотрудник, k] - рабочие дни до дня first_ordinal + k (сквозная сумма).
+        Часы складываются по сменам в том же порядке, что и при поштучном подсчёте за месяц,
+        поэтому значения совпадают с ним до бита. Длительность смены считается
+        по объединённой строке, как в get_employee_schedule.
+        """
+        n_days = int(self.day_ordinals[-1]) - self._first_ordinal + 1 if len(self.day_ordinals) else 0
+        ordinals = range(self._first_ordinal, self._first_ordinal + n_days)
+        month_starts = [date.fromordinal(ordinal).day == 1 for ordinal in ordinals]
+        hours = np.zeros((len(self.names), n_days + 1), dtype=np.float64)
+        days = np.zeros((len(self.names), n_days + 1), dtype=np.int32)
+        for emp_id in range(len(self.names)):
+            running = 0.0
+            row = [0.0]
+            for ordinal, month_start in zip(ordinals, month_starts):
+                if month_start:
+                    running = 0.0
+                shifts = self.shift_index.get((emp_id, ordinal))
+                if shifts:
+                    days[emp_id, ordinal - self._first_ordinal + 1] = 1
+                    for _, _, start_str, end_str in shifts:
+                        slot = parse_slot(f"{start_str}-{end_str}")
+                        if slot is not None:
+                            running += (slot.end_min - slot.start_min) / 60
+                row.append(running)
+            hours[emp_id] = row
+        return hours, np.cumsum(days, axis=1)
+
+    def employee_month_totals(self, emp_id, month_first_ordinal, end_ordinal):
+        """
+        Часы и рабочие дни сотрудника с 1-го числа месяца (month_first_ordinal) до end_ordinal
+        не включая. Без смен часы - целый 0, как при поштучном сложении.
+        """
+        last = self._cum_days.shape[1] - 1
+        lo = min(max(month_first_ordinal - self._first_ordinal, 0), last)
+        hi = min(max(end_ordinal - self._first_ordinal, 0), last)
+        if hi <= lo:
+            return 0, 0
+        days = int(self._cum_days[emp_id, hi] - self._cum_days[emp_id, lo])
+        if not days:
+            return 0, 0
+        return float(self._cum_hours[emp_id, hi]), days
+
+    def period_stats(self, first_ordinal, last_ordinal):
+        """
+        Статистика отдела за дни с first_ordinal по last_ordinal включительно, без циклов по слотам.
+        Суммы накапливаются по слотам в порядке графика (bincount и cumsum складывают
+        последовательно), поэтому совпадают с поштучным подсчётом.
+        Возвращает словарь:
+            total_hours       - часы всех разобранных слотов;
+            employee_hours    - {имя: часы} в порядке первого появления в периоде;
+            unassigned        - [(дата, строка времени)] слотов без ответственного;
+            day_ordinals      - дни периода, где есть слоты;
+            day_hours         - часы слотов по этим дням;
+            day_unassigned    - из них часы без ответственного.
+        """
+        lo, hi = self.period_range(first_ordinal, last_ordinal)
+        day_lo, day_hi = np.searchsorted(self.day_ordinals, [first_ordinal, last_ordinal + 1])
+        day_ordinals = self.day_ordinals[day_lo:day_hi]
+
+        starts = self.starts[lo:hi]
+        valid = starts != NO_MINUTES
+        hours = (self.ends[lo:hi][valid] - starts[valid]) / 60.0
+        emp_ids = self.emp_ids[lo:hi][valid].astype(np.intp)
+        dates = self.dates[lo:hi][valid]
+        assigned = self.assigned[emp_ids]
+        unassigned = ~assigned
+
+        per_employee = np.bincount(emp_ids[assigned], weights=hours[assigned], minlength=len(self.names))
+        present, first_seen = np.unique(emp_ids[assigned], return_index=True)
+        order = present[np.argsort(first_seen)].tolist()
+        per_employee = per_employee.tolist()
+
+        day_index = np.searchsorted(day_ordinals, dates)
+        n_days = len(day_ordinals)
+        return {
+            'total_hours': float(np.cumsum(hours)[-1]) if len(hours) else 0.0,
+            'employee_hours': {self.names[i]: per_employee[i] for i in order},
+            'unassigned': list(zip(dates[unassigned].tolist(),
+                                   (self.time_labels[t] for t in self.time_ids[lo:hi][valid][unassigned].tolist()))),
+            'day_ordinals': day_ordinals,
+            'day_hours': np.bincount(day_index, weights=hours, minlength=n_days),
+            'day_unassigned': np.bincount(day_index[unassigned], weights=hours[unassigned], minlength=n_days),
+        }
+
+    def active_intervals(self, minute):
+        """Номера всех интервалов шкалы, идущих в абсолютную минуту minute, по времени начала."""
+        found = []
+        i = bisect_right(self.timeline_starts, minute) - 1
+        while i >= 0 and self._timeline_reach[i] > minute:
+            if self.timeline_ends[i] > minute:
+                found.append(i)
+            i -= 1
+        found.reverse()
+        return found
+
+    def duty_at(self, minute):
+        """
+        Дежурство на абсолютную минуту minute: (текущие интервалы, следующий интервал,
+        минута передачи смены). Смены могут перекрываться, поэтому текущих интервалов
+        может быть несколько (список по времени начала, пустой - никто не дежурит).
+        Передача смены - самое раннее из их окончаний; следующий - тот, кто в этот момент
+        на смене, но не входит в текущих. Следующий интервал - номер на шкале или None.
+        """
+        current = self.active_intervals(minute)
+        starts = self.timeline_starts
+        if current:
+            handover = min(self.timeline_ends[i] for i in current)
+            joining = [i for i in self.active_intervals(handover) if i not in current]
+            if joining:
+                # Смену принимает заступивший последним
+                following = joining[-1]
+            else:
+                # После смены перерыв или остаются только текущие: следующим будет тот, кто заступит первым
+                i = bisect_left(starts, handover)
+                following = i if i < len(starts) else None
+            return current, following, handover
+        i = bisect_right(starts, minute)
+        if i == len(starts):
+            return [], None, None
+        return [], i, starts[i]
+
+    def merged_shifts(self, emp_id, day):
+        """
+        Смены сотрудника за день: подряд идущие слоты объединены.
+        Возвращает кортеж (начало, конец, строка начала, строка конца), пустой - если смен нет.
+        """
+        return self.shift_index.get((emp_id, day.toordinal()), ())
+
+    def to_schedule(self):
+        """Восстанавливает словарь "YYYY-MM-DD" -> [{'employee', 'time'}] в порядке дат."""
+        schedule = {}
+        names = self.names
+        labels = self.time_labels
+        bounds = self.day_bounds.tolist()
+        emp_ids = self.emp_ids.tolist()
+        time_ids = self.time_ids.tolist()
+        for i, ordinal in enumerate(self.day_ordinals.tolist()):
+            schedule[date.fromordinal(ordinal).isoformat()] = [
+                {'employee': names[emp_ids[j]], 'time': labels[time_ids[j]]}
+                for j in range(bounds[i], bounds[i + 1])
+            ]
+        return schedule
@@ -0,0 +1,62 @@
+"""
+Разбор строк времени слотов графика ("9:00-10:00").
+В графике всего несколько десятков разных строк, поэтому каждая разбирается один раз:
+результат запоминается (с ограничением размера) и дальше отдаётся готовой записью.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+MINUTES_PER_DAY = 24 * 60
+SLOT_CACHE_SIZE = 4096  # с запасом: в реальном графике разных строк несколько десятков
+
+SlotTime = namedtuple('SlotTime', [
+    'start_min',         # начало в минутах от полуночи
+    'end_min',           # конец в минутах; для смены через полночь - больше 1440
+    'start_str',         # исходные части строки: "9:00", "10:00"
+    'end_str',
+    'start_label',       # части с ведущим нулём в часе: "09:00", "10:00"
+    'end_label',
+    'label',             # "09:00-10:00"
+    'crosses_midnight',  # конец приходится на следующие сутки
+])
+
+
+def _pad_hour(time_str):
+    """Добавляет ведущий ноль к часу: "9:00" -> "09:00"."""
+    h, m = time_str.split(':')
+    return f"{int(h):02d}:{m}"
+
+
+@lru_cache(maxsize=SLOT_CACHE_SIZE)
+def parse_slot(time_str):
+    """
+    Разбирает "H:MM-H:MM" в SlotTime. Для одной и той же строки возвращается
+    один и тот же объект. None - если строка не похожа на интервал времени.
+    """
+    try:
+        start_str, end_str = time_str.split('-')
+        start_h, start_m = map(int, start_str.split(':'))
+        end_h, end_m = map(int, end_str.split(':'))
+    except (ValueError, AttributeError):
+        return None
+    if end_h < start_h or (end_h == start_h and end_m < start_m):
+        end_h += 24
+    start_min = start_h * 60 + start_m
+    end_min = end_h * 60 + end_m
+    start_label = _pad_hour(start_str)
+    end_label = _pad_hour(end_str)
+    return SlotTime(
+        start_min=start_min,
+        end_min=end_min,
+        start_str=start_str,
+        end_str=end_str,
+        start_label=start_label,
+        end_label=end_label,
+        label=f"{start_label}-{end_label}",
+        crosses_midnight=end_min >= MINUTES_PER_DAY,
+    )
+
+
+def slot_cache_info():
+    """Счётчики попаданий и промахов кэша разбора."""
+    return parse_slot.cache_info()
@@ -0,0 +1,220 @@
+"""
+Общее хранилище SQLite: пользователи, настройки, доступ, руководители и состояния FSM в одном файле.
+Одно долгоживущее соединение (WAL) на процесс и общая блокировка записи для
+UserDatabase и AccessControl. Схема версионируется через PRAGMA user_version:
+при открытии выполняются только миграции новее текущей версии файла.
+"""
+import aiosqlite
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+STORE_FILE = 'bot_data.db'
+# Файлы прежних версий бота; их данные переносятся при первом запуске, сами файлы не трогаются
+LEGACY_USERS_FILE = 'bot_users.db'
+LEGACY_ACCESS_FILE = 'bot_access.db'
+
+_TABLES = (
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        is_l15 BOOLEAN,
+        employee_name TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_settings (
+        user_id INTEGER PRIMARY KEY,
+        remind_before_hour BOOLEAN DEFAULT 0,
+        daily_remind_time TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS access_list (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        granted_by INTEGER,
+        granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT 1
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS directors (
+        user_id INTEGER PRIMARY KEY,
+        added_by INTEGER,
+        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES access_list(user_id) ON DELETE CASCADE
+    )
+    ''',
+)
+
+_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_users_employee_name ON users(employee_name)',
+    'CREATE INDEX IF NOT EXISTS idx_user_settings_daily_remind_time ON user_settings(daily_remind_time)',
+    'CREATE INDEX IF NOT EXISTS idx_access_list_is_active ON access_list(is_active)',
+)
+
+
+async def _create_tables(store, db):
+    for sql in _TABLES:
+        await db.execute(sql)
+
+
+async def _create_indexes(store, db):
+    for sql in _INDEXES:
+        await db.execute(sql)
+
+
+async def _create_fsm_table(store, db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_state (
+            storage_key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+async def _table_columns(db, schema, table):
+    async with db.execute(f'PRAGMA {schema}.table_info({table})') as cursor:
+        return [row[1] for row in await cursor.fetchall()]
+
+
+async def _import_legacy(store, db):
+    """Переносит строки из прежних bot_users.db и bot_access.db (уже имеющиеся не перезаписываются)."""
+    sources = (
+        (store.legacy_users_path, ('users', 'user_settings')),
+        (store.legacy_access_path, ('access_list', 'directors')),
+    )
+    for path, tables in sources:
+        if not path or not os.path.exists(path) or os.path.abspath(path) == os.path.abspath(store.path):
+            continue
+        # ATTACH/DETACH нельзя выполнять внутри транзакции
+        await db.commit()
+        await db.execute('ATTACH DATABASE ? AS legacy', (path,))
+        try:
+            for table in tables:
+                legacy_columns = await _table_columns(db, 'legacy', table)
+                if not legacy_columns:
+                    continue
+                main_columns = await _table_columns(db, 'main', table)
+                columns = ', '.join(c for c in legacy_columns if c in main_columns)
+                cursor = await db.execute(
+                    f'INSERT OR IGNORE INTO main.{table} ({columns}) SELECT {columns} FROM legacy.{table}'
+                )
+                logger.info(f"Перенесено строк {table} из {path}: {cursor.rowcount}")
+                await cursor.close()
+            await db.commit()
+        finally:
+            await db.execute('DETACH DATABASE legacy')
+
+
+# (версия, описание, функция); новые миграции добавляются только в конец
+MIGRATIONS = (
+    (1, 'таблицы пользователей, настроек, доступа и руководителей', _create_tables),
+    (2, 'индексы по employee_name, daily_remind_time, is_active', _create_indexes),
+    (3, 'перенос данных из bot_users.db и bot_access.db', _import_legacy),
+    (4, 'таблица состояний FSM', _create_fsm_table),
+)
+
+
+class Transaction:
+    """Открытая транзакция: соединение и действия, которые нужно выполнить после commit."""
+
+    def __init__(self, db):
+        self.db = db
+        self._on_commit = []
+
+    def on_commit(self, callback):
+        """Регистрирует функцию без аргументов, вызываемую только после успешного commit."""
+        self._on_commit.append(callback)
+
+
+class SqliteStore:
+    """Менеджер соединения с общей БД бота."""
+
+    def __init__(self, path=STORE_FILE, legacy_users_path=LEGACY_USERS_FILE,
+                 legacy_access_path=LEGACY_ACCESS_FILE):
+        self.path = path
+        self.legacy_users_path = legacy_users_path
+        self.legacy_access_path = legacy_access_path
+        self._db = None
+        self._open_lock = asyncio.Lock()
+        # Запись из нескольких выражений не должна перемежаться с чужой в общей транзакции
+        self.write_lock = asyncio.Lock()
+
+    async def connection(self):
+        """Соединение с БД; при первом обращении открывает файл и применяет миграции."""
+        if self._db is not None:
+            return self._db
+        async with self._open_lock:
+            if self._db is None:
+                db = await aiosqlite.connect(self.path)
+                try:
+                    db.row_factory = aiosqlite.Row
+                    await db.execute('PRAGMA journal_mode=WAL')
+                    await db.execute('PRAGMA synchronous=NORMAL')
+                    await self._migrate(db)
+                except Exception:
+                    await db.close()
+                    raise
+                self._db = db
+        return self._db
+
+    async def _migrate(self, db):
+        async with db.execute('PRAGMA user_version') as cursor:
+            version = (await cursor.fetchone())[0]
+        for target, description, apply in MIGRATIONS:
+            if target <= version:
+                continue
+            await apply(self, db)
+            await db.execute(f'PRAGMA user_version = {target}')
+            await db.commit()
+            logger.info(f"БД {self.path} обновлена до версии {target}: {description}")
+
+    @asynccontextmanager
+    async def transaction(self, outer=None):
+        """
+        Одна транзакция под блокировкой записи: commit при выходе, rollback при ошибке.
+        Если передана внешняя транзакция, работа идёт в ней (commit сделает внешний блок).
+        """
+        if outer is not None:
+            yield outer
+            return
+        db = await self.connection()
+        async with self.write_lock:
+            tx = Transaction(db)
+            try:
+                yield tx
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+        for callback in tx._on_commit:
+            callback()
+
+    @asynccontextmanager
+    async def committed_read(self):
+        """
+        Соединение для чтения, которое попадёт в кэш. Соединение одно на всех, поэтому
+        без блокировки записи чтение увидело бы строки ещё не зафиксированной транзакции,
+        а после её отката кэш хранил бы то, чего в БД нет.
+        """
+        db = await self.connection()
+        async with self.write_lock:
+            yield db
+
+    async def close(self):
+        """Закрывает соединение при остановке бота."""
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+            logger.info(f"Соединение с БД закрыто: {self.path}")